@@ -121,6 +121,27 @@ const LatLng kInitialCameraPosition = LatLng(37.5665, 126.9780);
 
 // ✅ 마감 임박 임계값 상수 추가
 const int kDeadlineThresholdDays = 5;
+
+// ----------------------------------------------------
+// ETag 조건부 요청 (목록 API 응답 재사용)
+// ----------------------------------------------------
+
+const int kEtagCacheSize = 20;
+final Map<String, http.Response> _etagResponseCache = {};
+
+/// 이전 응답의 ETag로 If-None-Match 요청을 보내고, 304면 저장해 둔 응답을 그대로 반환
+Future<http.Response> getWithEtag(Uri uri) async {
+  final key = uri.toString();
+  final cached = _etagResponseCache.remove(key);
+  final etag = cached?.headers['etag'];
+  final response = await http.get(uri, headers: {if (etag != null) 'If-None-Match': etag});
+  final result = (response.statusCode == 304 && cached != null) ? cached : response;
+  if (result.statusCode == 200 && result.headers['etag'] != null) {
+    _etagResponseCache[key] = result; // 최근 사용 순서 유지
+    if (_etagResponseCache.length > kEtagCacheSize) _etagResponseCache.remove(_etagResponseCache.keys.first);
+  }
+  return result;
+}
 // ----------------------------------------------------
 // App Entry Point
 // ----------------------------------------------------
@@ -441,7 +462,7 @@ class _CompetitionMapScreenState extends State<CompetitionMapScreen> {
 
   Future<void> _fetchDataAndUpdateMap(Uri uri) async {
     try {
-      final response = await http.get(uri);
+      final response = await getWithEtag(uri);
       if (response.statusCode == 200) {
         final data = json.decode(utf8.decode(response.bodyBytes));
         if (data['success'] == true && data['data'] != null) {
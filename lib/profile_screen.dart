@@ -252,6 +252,16 @@ class _ProfileScreenState extends State<ProfileScreen> {
         await Supabase.instance.client.from('interesting_sports').insert(sportsData);
       }
 
+      // 💡 서버의 프로필 캐시 초기화 (실패해도 저장은 완료된 상태이므로 무시, 캐시는 짧은 시간 후 자동 만료)
+      try {
+        final session = Supabase.instance.client.auth.currentSession;
+        if (session != null) {
+          await http.post(Uri.parse('$kBaseUrl/profile/invalidate'), headers: {
+            'Authorization': 'Bearer ${session.accessToken}',
+          });
+        }
+      } catch (_) {}
+
       setState(() {
         _initialAddress = currentAddress;
       });
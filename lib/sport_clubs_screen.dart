@@ -1,7 +1,6 @@
 import 'package:flutter/material.dart';
-import 'package:http/http.dart' as http;
 import 'dart:convert';
-import 'package:sports_app1/main.dart'; // For kBaseUrl, kSportCategories, etc.
+import 'package:sports_app1/main.dart'; // For kBaseUrl, kSportCategories, getWithEtag, etc.
 
 class SportClub {
   final String id;
@@ -85,7 +84,7 @@ class _SportClubsScreenState extends State<SportClubsScreen> {
     final uri = Uri.parse('$kBaseUrl/clubs').replace(queryParameters: queryParams);
 
     try {
-      final response = await http.get(uri);
+      final response = await getWithEtag(uri);
       if (response.statusCode == 200) {
         final data = json.decode(utf8.decode(response.bodyBytes));
         if (data['success'] == true && data['data'] != null) {
@@ -69,29 +69,19 @@ class _TeamBoardDetailScreenState extends State<TeamBoardDetailScreen> {
     });
 
     try {
-      final postFuture = http.get(Uri.parse('$kBaseUrl/team-board/${widget.postId}'));
-      final repliesFuture = http.get(Uri.parse('$kBaseUrl/team-board/${widget.postId}/replies'));
-      
-      final responses = await Future.wait([postFuture, repliesFuture]);
+      // 게시글 + 작성자 + 댓글을 한 번의 요청으로 조회
+      final response = await http.get(Uri.parse('$kBaseUrl/team-board/${widget.postId}?include_replies=true'));
 
-      if (responses[0].statusCode == 200) {
-        final postData = json.decode(utf8.decode(responses[0].bodyBytes));
+      if (response.statusCode == 200) {
+        final postData = json.decode(utf8.decode(response.bodyBytes));
         if (postData['success'] == true && postData['data'] != null) {
           _post = TeamBoardPost.fromJson(postData['data']);
+          _replies = ((postData['replies'] ?? []) as List).map((r) => Reply.fromJson(r)).toList();
         } else {
           throw Exception(postData['detail'] ?? '게시글 로딩 실패');
         }
       } else {
-        throw Exception('API 오류 (게시글): ${responses[0].statusCode}');
-      }
-
-      if (responses[1].statusCode == 200) {
-        final repliesData = json.decode(utf8.decode(responses[1].bodyBytes));
-        if (repliesData['success'] == true && repliesData['data'] != null) {
-          _replies = (repliesData['data'] as List).map((r) => Reply.fromJson(r)).toList();
-        }
-      } else {
-         _showSnackBar('댓글 로딩 실패');
+        throw Exception('API 오류 (게시글): ${response.statusCode}');
       }
 
     } catch (e) {
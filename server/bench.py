@@ -0,0 +1,333 @@
+"""서버 핫패스 마이크로벤치마크
+
+사용법: python bench.py            # 전체 실행
+        python bench.py grade      # 지정한 항목만 실행
+"""
+import asyncio
+import datetime
+import random
+import sys
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+import main
+
+def _legacy_get_skill_level_from_grade(sport: str, grade: Optional[str]) -> str:
+    # 사전 인덱스 도입 전 구현 (비교 기준)
+    grade = grade.strip().replace(' ', '') if grade else ""
+    if not grade: return "무관"
+    try: sport_enum = main.SportCategory(sport)
+    except ValueError: return "무관"
+    mapping = main.GRADE_SKILL_MAP.get(sport_enum, {})
+    normalized_grade = grade.upper().replace(' ', '')
+    for skill_level, grades in mapping.items():
+        if normalized_grade in [g.upper().replace(' ', '') for g in grades]: return skill_level
+    return "무관"
+
+def _legacy_top_n_by_title(candidates: list, top_n: int) -> list:
+    # 힙 선택 도입 전 구현 (비교 기준): 제목별 최고 점수 dict를 만든 뒤 점수순 안정 정렬 후 자르기
+    best_by_title: Dict[str, tuple] = {}
+    for title, score, payload in candidates:
+        if title and (title not in best_by_title or score > best_by_title[title][1]): best_by_title[title] = (title, score, payload)
+    return [payload for _, _, payload in sorted(best_by_title.values(), key=lambda c: c[1], reverse=True)[:top_n]]
+
+def _report(name: str, fn: Callable[[], object], number: int, items: int = 1, baseline: Optional[float] = None) -> float:
+    # fn 한 번 호출이 items 건을 처리한다고 보고 건당 시간을 출력
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number / items
+    speedup = f"  (x{baseline / best:.1f})" if baseline else ""
+    print(f"  {name:<28} {best * 1e9:12.1f} ns/건{speedup}")
+    return best
+
+def bench_grade() -> None:
+    """get_skill_level_from_grade: 실제 대회 데이터와 비슷한 등급 분포 (알려진 등급 위주 + 공백/미등록 등급 일부)"""
+    rng = random.Random(42)
+    known = [(sport.value, g) for sport, mapping in main.GRADE_SKILL_MAP.items() for grades in mapping.values() for g in grades if g]
+    unseen = [(sport.value, g) for sport in main.SportCategory for g in ("일반", "남자부", "혼합복식", "10 km", "학생 부")]
+    samples = rng.choices(known, k=8000) + rng.choices(unseen, k=1500) + [(s.value, None) for s in rng.choices(list(main.SportCategory), k=500)]
+    rng.shuffle(samples)
+
+    for sport, grade in samples:
+        assert main.get_skill_level_from_grade(sport, grade) == _legacy_get_skill_level_from_grade(sport, grade), (sport, grade)
+
+    uncached = main.get_skill_level_from_grade.__wrapped__
+    print(f"grade -> skill ({len(samples)}건)")
+    n = len(samples)
+    base = _report("legacy (list scan)", lambda: [_legacy_get_skill_level_from_grade(s, g) for s, g in samples], 3, n)
+    _report("index", lambda: [uncached(s, g) for s, g in samples], 20, n, base)
+    _report("index + lru_cache", lambda: [main.get_skill_level_from_grade(s, g) for s, g in samples], 20, n, base)
+
+def bench_wkb(count: int = 20000) -> None:
+    """location 컬럼 해석: shapely.wkb.loads vs struct 기반 단건 디코더 vs np.frombuffer 일괄 디코더"""
+    from shapely import wkb
+    from shapely.geometry import Point
+    rng = random.Random(7)
+    # PostGIS가 돌려주는 EWKB(SRID 4326) 형태
+    hexes = [wkb.dumps(Point(rng.uniform(126, 130), rng.uniform(33, 38)), hex=True, srid=4326) for _ in range(count)]
+
+    def with_shapely() -> list:
+        points = []
+        for h in hexes:
+            geom = wkb.loads(bytes.fromhex(h)); points.append((geom.x, geom.y))
+        return points
+
+    xs, ys = main.decode_locations(hexes)
+    assert [main.decode_location(h) for h in hexes] == with_shapely() == list(zip(xs.tolist(), ys.tolist()))
+    print(f"WKB POINT 해석 ({count}건)")
+    base = _report("shapely.wkb.loads", with_shapely, 3, count)
+    _report("decode_location (struct)", lambda: [main.decode_location(h) for h in hexes], 3, count, base)
+    _report("decode_locations (batch)", lambda: main.decode_locations(hexes), 10, count, base)
+
+_PROVINCES = ["서울특별시", "부산광역시", "대구광역시", "인천광역시", "광주광역시", "대전광역시", "울산광역시", "세종특별자치시",
+              "경기도", "강원특별자치도", "충청북도", "충청남도", "전북특별자치도", "전라남도", "경상북도", "경상남도", "제주특별자치도"]
+
+def _synthetic_snapshot(rng: random.Random, count: int) -> "main.CompetitionSnapshot":
+    from shapely.geometry import Point
+    sports = [s.value for s in main.SportCategory]
+    rows = [{
+        "id": i, "title": f"대회 {i % (count // 3)}", "sport_category": rng.choice(sports),
+        "grade": rng.choice(["풀", "10km", "5km", "신인부", "챌린저부", "A급", "E급", "오픈", None]),
+        "age": rng.choice([None, "20세 이상", "30~49세", "무관"]), "gender": rng.choice([None, "남", "여", "무관"]),
+        "event_period": f"[2030-0{rng.randint(1, 9)}-01,2030-0{rng.randint(1, 9)}-02)" if rng.random() < 0.95 else None,
+        "location_province_city": province, "location_county_district": f"{province} {rng.randint(1, 12)}구",
+        "location": Point(rng.uniform(126, 130), rng.uniform(33, 38)).wkb_hex if rng.random() < 0.9 else None,
+    } for i, province in enumerate(rng.choices(_PROVINCES, k=count))]
+    records = main.ingest_competitions(rows)
+    return main.CompetitionSnapshot(records=records, matrix=main.CompetitionMatrix(records), index=main.competition_filter_index(records), version=1, state=None, loaded_at=time.time())
+
+def bench_recommend_batch(competitions: int = 5000, users: int = 2000) -> None:
+    """전체 사용자 추천: 사용자마다 score() + select_by_sport(엔드포인트와 같은 경로) vs 사용자 × 대회 행렬 일괄 계산(recommend_many)"""
+    rng = random.Random(11)
+    snapshot = _synthetic_snapshot(rng, competitions)
+    sports = [s.value for s in main.SportCategory]
+    profiles = [{
+        "id": f"user-{u}", "age": rng.randint(15, 70), "gender": rng.choice(["남", "여"]),
+        "user_latitude": rng.uniform(33, 38), "user_longitude": rng.uniform(126, 130),
+        "interesting_sports": [{"sport_name": s, "skill": rng.choice(["상", "중", "하"])} for s in rng.sample(sports, rng.randint(1, 3))],
+    } for u in range(users)]
+    today = datetime.date(2030, 1, 1)
+
+    def per_user() -> list:
+        results = []
+        for profile in profiles:
+            user_sports = [s['sport_name'] for s in profile['interesting_sports']]
+            idx, scores, skill_scores, loc_scores = snapshot.matrix.score(profile, today)
+            results.append(main.build_recommendations(snapshot.records, idx, scores, skill_scores, loc_scores, main.select_by_sport(snapshot.matrix, user_sports, idx, scores, 3)))
+        return results
+
+    assert per_user() == main.recommend_many(snapshot, profiles, 3, today)
+    print(f"사용자별 추천 일괄 계산 (대회 {competitions}건 x 사용자 {users}명)")
+    base = _report("per-user score()", per_user, 1, users)
+    _report("recommend_many (batch)", lambda: main.recommend_many(snapshot, profiles, 3, today), 1, users, base)
+
+def bench_top_n(cases: int = 3000, count: int = 50000) -> None:
+    """추천 엔드포인트의 종목별 제목 중복 제거 + 상위 N개: 후보별 dict + 정렬 vs select_by_sport(top_n_by_title). 점수 동점이 많은 입력으로 동점 처리까지 검증"""
+    rng = random.Random(23)
+    for _ in range(cases):
+        titles = [None, ""] + [f"대회 {t}" for t in range(rng.randint(1, 12))]
+        scores = [rng.randint(0, 4) / 4 for _ in range(rng.randint(1, 5))]  # 점수 종류를 적게 두어 동점을 자주 만든다
+        candidates = [(rng.choice(titles), rng.choice(scores), k) for k in range(rng.randint(0, 40))]
+        top_n = rng.randint(0, 6)
+        title_codes: Dict[str, int] = {}
+        codes = np.array([title_codes.setdefault(t, len(title_codes)) if t else -1 for t, _, _ in candidates], dtype=np.int64)
+        batch = main.top_n_by_title(np.zeros(len(candidates), dtype=np.int64), codes, np.array([c[1] for c in candidates], dtype=np.float64), top_n)
+        assert batch.get(0, []) == _legacy_top_n_by_title(candidates, top_n), (candidates, top_n)
+
+    snapshot = _synthetic_snapshot(rng, count)
+    profile = {"id": "user-1", "age": 35, "gender": "남", "user_latitude": 37.5, "user_longitude": 127.0,
+               "interesting_sports": [{"sport_name": "마라톤", "skill": "상"}, {"sport_name": "테니스", "skill": "중"}]}
+    user_sports = [s["sport_name"] for s in profile["interesting_sports"]]
+    idx, scores, _, _ = snapshot.matrix.score(profile, datetime.date(2030, 1, 1))
+
+    def with_dict() -> dict:
+        by_sport: Dict[str, list] = {s: [] for s in user_sports}
+        for k, (i, score) in enumerate(zip(idx.tolist(), scores.tolist())):
+            record = snapshot.records[i]
+            by_sport[record.sport_category].append((record.title, score, k))
+        return {s: _legacy_top_n_by_title(c, 3) for s, c in by_sport.items()}
+
+    assert with_dict() == main.select_by_sport(snapshot.matrix, user_sports, idx, scores, 3)
+    print(f"종목별 제목 상위 3개 선택 (대회 {count}건 중 후보 {len(idx)}건, 무작위 검증 {cases}회)")
+    base = _report("dict + sort", with_dict, 20, len(idx))
+    _report("select_by_sport", lambda: main.select_by_sport(snapshot.matrix, user_sports, idx, scores, 3), 20, len(idx), base)
+
+def bench_score_location(count: int = 50000, users: int = 200) -> None:
+    """score()의 위치 점수: 조건 통과 행 전체 거리 계산 vs 격자 색인으로 MAX_DIST_KM 안쪽만 고른 뒤 계산"""
+    rng = random.Random(29)
+    snapshot = _synthetic_snapshot(rng, count)
+    matrix = snapshot.matrix
+    points = [(rng.uniform(33, 38), rng.uniform(126, 130)) for _ in range(users)]
+    idx = np.arange(len(matrix.sport))
+
+    def unindexed(lat: float, lon: float) -> np.ndarray:
+        location_score = np.full(len(idx), 0.5)
+        located = matrix.has_location[idx]
+        location_score[located] = 1.0 - np.minimum(matrix.distances_from(lat, lon, idx[located]), main.MAX_DIST_KM) / main.MAX_DIST_KM
+        return location_score
+
+    def grid_bounded(lat: float, lon: float) -> np.ndarray:
+        location_score = np.full(len(idx), 0.5)
+        location_score[matrix.has_location[idx]] = 0.0
+        near = np.zeros(len(matrix.sport), dtype=bool)
+        near[matrix.spatial.query(lat, lon, main.MAX_DIST_KM)] = True
+        located = near[idx]
+        location_score[located] = 1.0 - np.minimum(matrix.distances_from(lat, lon, idx[located]), main.MAX_DIST_KM) / main.MAX_DIST_KM
+        return location_score
+
+    for lat, lon in points: assert np.array_equal(unindexed(lat, lon), grid_bounded(lat, lon)), (lat, lon)
+    within = np.mean([len(matrix.spatial.query(lat, lon, main.MAX_DIST_KM)) / matrix.has_location.sum() for lat, lon in points])
+    print(f"위치 점수 (대회 {count}건, 사용자 위치 {users}곳, 격자 후보 비율 {within:.0%})")
+    base = _report("grid-bounded", lambda: [grid_bounded(lat, lon) for lat, lon in points], 1, users)
+    _report("unindexed (score)", lambda: [unindexed(lat, lon) for lat, lon in points], 1, users, base)
+
+def bench_result_cache(competitions: int = 5000) -> None:
+    """추천 결과 캐시: 매번 계산 vs 메모리(TTLCache) 적중 vs SQLite 적중(재시작 직후처럼 메모리가 빈 상태)"""
+    import os
+    import tempfile
+    rng = random.Random(3)
+    snapshot = _synthetic_snapshot(rng, competitions)
+    profile = {"id": "user-1", "age": 35, "gender": "남", "user_latitude": 37.5, "user_longitude": 127.0,
+               "interesting_sports": [{"sport_name": "마라톤", "skill": "상"}, {"sport_name": "테니스", "skill": "중"}]}
+    today = datetime.date(2030, 1, 1)
+    compute = lambda: main.recommend_many(snapshot, [profile], 3, today)[0]
+    value = compute()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite3")
+        main.TieredCache(100, 3600, path).set("key", value)
+        warm = main.TieredCache(100, 3600, path)
+        assert warm.get("key") == value
+
+        print(f"추천 결과 조회 (대회 {competitions}건, 추천 {sum(len(v) for v in value.values())}건)")
+        base = _report("compute", compute, 20)
+        _report("memory hit", lambda: warm.get("key"), 10000, 1, base)
+        _report("sqlite hit", lambda: warm.disk.get("key"), 2000, 1, base)
+        warm.disk._conn.close()
+
+async def _asgi_get(app: object, path: str) -> bytes:
+    # 네트워크 없이 ASGI 앱을 직접 호출해 응답 본문을 받음 (라우팅 + 직렬화 비용만 측정)
+    scope = {"type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"", "headers": [],
+             "http_version": "1.1", "scheme": "http", "server": ("bench", 80), "client": ("bench", 1), "root_path": ""}
+    body = []
+    async def receive() -> dict: return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.body": body.append(message.get("body", b""))
+    await app(scope, receive, send)
+    return b"".join(body)
+
+def bench_serialize(count: int = 20000) -> None:
+    """대회 목록 응답: response_model=Dict[str, Any] 검증/인코딩 vs FastJSONResponse(orjson) vs 미리 직렬화한 행 이어 붙이기"""
+    import json
+    from typing import Any
+    from fastapi import FastAPI
+    rng = random.Random(5)
+    snapshot = _synthetic_snapshot(rng, count)
+    rows = [r.row for r in snapshot.records]
+    app = FastAPI()
+
+    @app.get("/legacy", response_model=Dict[str, Any])
+    async def legacy() -> dict: return {"success": True, "count": len(rows), "data": rows}
+
+    @app.get("/orjson", response_model=Dict[str, Any])
+    async def fast() -> object: return main.FastJSONResponse({"success": True, "count": len(rows), "data": rows})
+
+    @app.get("/prejson", response_model=Dict[str, Any])
+    async def prejson() -> object: return main.prejson_response({"success": True, "count": len(rows)}, [r.row_json for r in snapshot.records])
+
+    # 요청마다 asyncio.run을 쓰면 루프 정리 비용(큰 결과의 repr 등)이 섞이므로 루프 하나를 재사용
+    loop = asyncio.new_event_loop()
+    get = lambda path: loop.run_until_complete(_asgi_get(app, path))
+    try:
+        bodies = [json.loads(get(path)) for path in ("/legacy", "/orjson", "/prejson")]
+        assert bodies[0] == bodies[1] == bodies[2]
+        print(f"대회 목록 응답 직렬화 ({count}건, orjson {'사용' if main.orjson else '없음'})")
+        base = _report("response_model (legacy)", lambda: get("/legacy"), 3, count)
+        _report("FastJSONResponse", lambda: get("/orjson"), 3, count, base)
+        _report("prejson_response", lambda: get("/prejson"), 3, count, base)
+    finally:
+        loop.close()
+
+def bench_filter(count: int = 20000) -> None:
+    """목록 필터: 전체 레코드 선형 스캔(filter_competitions) vs 역색인 교집합 + 시작일 이진 탐색(FilterIndex.query)"""
+    rng = random.Random(13)
+    snapshot = _synthetic_snapshot(rng, count)
+    cases = {
+        "종목": (main.SportCategory.마라톤.value, None, None, None),
+        "종목+시도+시군구": (main.SportCategory.마라톤.value, "경기도", "경기도 3구", None),
+        "시도+개최일": (None, "서울특별시", None, "2030-06-01"),
+        "전체 조건": (main.SportCategory.마라톤.value, "경기도", "경기도 3구", "2030-06-01"),
+    }
+    print(f"대회 목록 필터 ({count}건)")
+    for name, args in cases.items():
+        expected = list(main.filter_competitions(snapshot.records, *args))
+        assert [snapshot.records[i] for i in snapshot.index.query(*args).tolist()] == expected
+        print(f" {name} ({len(expected)}건)")
+        base = _report("filter_competitions", lambda: list(main.filter_competitions(snapshot.records, *args)), 10)
+        _report("FilterIndex.query", lambda: snapshot.index.query(*args), 1000, 1, base)
+
+def bench_sync(count: int = 20000, changes: int = 50) -> None:
+    """대회 스냅샷 갱신(네트워크 제외): 전체 재구성(ingest + 행렬 + 역색인) vs 변경분만 반영(apply_competition_changes)"""
+    rng = random.Random(17)
+    snapshot = _synthetic_snapshot(rng, count)
+    rows = {r.id: {**r.row, "location": None} for r in snapshot.records}
+    changed_ids = rng.sample(sorted(rows), changes // 2) + list(range(count, count + changes // 2))  # 수정 절반 + 추가 절반
+    upserts = {i: {**rows.get(i, rows[0]), "id": i, "title": f"변경 {i}"} for i in changed_ids}
+    state = main.TableState(count + changes // 2, "t1")
+
+    def full() -> object:
+        merged = {**rows, **upserts}
+        records = main.ingest_competitions([merged[i] for i in sorted(merged)])
+        return main.CompetitionMatrix(records), main.competition_filter_index(records)
+
+    assert main.apply_competition_changes(snapshot, upserts, set(), state) is not None
+    print(f"대회 스냅샷 갱신 ({count}건 중 {changes}건 변경)")
+    base = _report("전체 재구성", full, 1)
+    _report("apply_competition_changes", lambda: main.apply_competition_changes(snapshot, upserts, set(), state), 5, 1, base)
+
+class _SlowQuery:
+    """네트워크 지연만 흉내 내는 가짜 쿼리 (.execute()가 latency초 동안 블로킹)"""
+    def __init__(self, latency: float): self.latency = latency
+    def execute(self) -> None: time.sleep(self.latency)
+
+def bench_db(requests: int = 64, latency: float = 0.05) -> None:
+    """동시 요청 부하: 이벤트 루프에서 직접 .execute() 하던 방식 vs run_db 스레드 풀"""
+    async def blocking_handler() -> None: _SlowQuery(latency).execute()
+    async def pooled_handler() -> None: await main.run_db(_SlowQuery(latency))
+
+    async def load(handler: Callable[[], object]) -> float:
+        start = time.perf_counter()
+        await asyncio.gather(*(handler() for _ in range(requests)))
+        return time.perf_counter() - start
+
+    print(f"동시 요청 {requests}건, 쿼리 지연 {latency * 1000:.0f}ms")
+    elapsed = asyncio.run(load(blocking_handler))
+    print(f"  {'blocking execute()':<28} {elapsed:8.2f} s  ({requests / elapsed:7.1f} req/s)")
+    original = main._db_executor
+    try:
+        for pool_size in (1, 4, 16, 64):
+            main._db_executor = ThreadPoolExecutor(max_workers=pool_size)
+            elapsed = asyncio.run(load(pooled_handler))
+            print(f"  {f'run_db (pool={pool_size})':<28} {elapsed:8.2f} s  ({requests / elapsed:7.1f} req/s)")
+            main._db_executor.shutdown()
+    finally:
+        main._db_executor = original
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "grade": bench_grade,
+    "wkb": bench_wkb,
+    "recommend_batch": bench_recommend_batch,
+    "top_n": bench_top_n,
+    "score_location": bench_score_location,
+    "result_cache": bench_result_cache,
+    "serialize": bench_serialize,
+    "filter": bench_filter,
+    "sync": bench_sync,
+    "db": bench_db,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
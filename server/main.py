@@ -1,19 +1,38 @@
 from fastapi import FastAPI, Query, HTTPException, Depends, Header
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 import os
 import jwt
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable, Awaitable, Iterable, NamedTuple
 from enum import Enum
 from supabase import create_client, Client
 # ✅ 공식 경로 사용 (권장)
 from supabase import ClientOptions
-from shapely import wkb
-from binascii import unhexlify
+import asyncio
 import datetime
+import argparse
+import bisect
+import hashlib
+import hmac
+import json
+import threading
 import math
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import time
 import uuid
+import numpy as np
 from pydantic import BaseModel
+try:
+    import orjson  # 있으면 대용량 목록 응답 직렬화에 사용
+except ImportError:
+    orjson = None
 
 # ====================================================
 # 환경변수 및 상수 설정
@@ -24,22 +43,99 @@ load_dotenv()
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_ANON_KEY")
 supabase_jwt_secret = os.getenv("SUPABASE_JWT_SECRET")
+# 서버 내부 작업(전체 사용자 추천 사전 계산)용: RLS를 우회해 모든 프로필을 읽을 서비스 키와 내부 호출 토큰
+supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+internal_api_token = os.getenv("INTERNAL_API_TOKEN")
 
 SUPABASE_PAGE_SIZE = 1000
+# 목록 API 페이지네이션: 한 번에 요청 가능한 최대 건수, 전체 건수 계산 방식 (exact | planned | estimated)
+LISTING_MAX_LIMIT = 1000
+LISTING_COUNT_METHOD = os.getenv("LISTING_COUNT_METHOD", "exact")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# 추천 점수 계산과 추천 응답(앱의 Competition.fromJson)에 필요한 대회 컬럼
+RECOMMENDATION_COLUMNS = "id, title, sport_category, grade, age, gender, location, event_period, location_name, location_province_city, location_county_district, homepage_url, registration_period"
+NDJSON_CHUNK_ROWS = 500
+# 페이지 동시 조회 수 / 일시 오류 재시도 횟수 및 대기 시간(초, 지수 증가)
+SUPABASE_FETCH_CONCURRENCY = int(os.getenv("SUPABASE_FETCH_CONCURRENCY", "4"))
+SUPABASE_FETCH_RETRIES = int(os.getenv("SUPABASE_FETCH_RETRIES", "3"))
+SUPABASE_RETRY_BACKOFF_SECONDS = float(os.getenv("SUPABASE_RETRY_BACKOFF_SECONDS", "0.5"))
+# 동기식 supabase-py 호출을 실행하는 스레드 풀 크기 (워커당 동시 DB 요청 상한)
+SUPABASE_DB_POOL_SIZE = int(os.getenv("SUPABASE_DB_POOL_SIZE", "16"))
+# 토큰별 인증 클라이언트 캐시 (최대 개수 / 최대 보관 시간(초), 실제 만료는 JWT exp를 넘지 않음)
+AUTHED_CLIENT_CACHE_SIZE = int(os.getenv("AUTHED_CLIENT_CACHE_SIZE", "256"))
+AUTHED_CLIENT_TTL_SECONDS = int(os.getenv("AUTHED_CLIENT_TTL_SECONDS", "3600"))
+# 검증된 JWT 캐시 (최대 개수 / 최대 보관 시간(초), 검증 실패 결과 보관 시간(초))
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_TTL_SECONDS = int(os.getenv("JWT_CACHE_TTL_SECONDS", "3600"))
+JWT_NEGATIVE_CACHE_TTL_SECONDS = int(os.getenv("JWT_NEGATIVE_CACHE_TTL_SECONDS", "30"))
+# 해석된 사용자 프로필 캐시 (최대 개수 / 보관 시간(초)). 앱이 프로필을 Supabase에 직접 저장하므로 TTL은 짧게 유지
+USER_PROFILE_CACHE_SIZE = int(os.getenv("USER_PROFILE_CACHE_SIZE", "10000"))
+USER_PROFILE_CACHE_TTL_SECONDS = int(os.getenv("USER_PROFILE_CACHE_TTL_SECONDS", "60"))
 EARTH_RADIUS_KM = 6371.0
 MAX_DIST_KM = 500.0
+SPATIAL_CELL_DEG = 0.5  # 공간 격자 인덱스 셀 크기(위경도 도 단위)
 SKILL_WEIGHT = 0.6
 LOCATION_WEIGHT = 0.4
 SKILL_RANK = {"상": 3, "중": 2, "하": 1, "무관": 0}
 
+# 대회 스냅샷 갱신 주기 (초): 전체 재적재 주기(워터마크 컬럼이 없을 때)와 워터마크(변경 감지) 확인 주기
+COMPETITION_REFRESH_SECONDS = int(os.getenv("COMPETITION_REFRESH_SECONDS", "600"))
+COMPETITION_WATERMARK_POLL_SECONDS = int(os.getenv("COMPETITION_WATERMARK_POLL_SECONDS", "30"))
+COMPETITION_WATERMARK_COLUMN = os.getenv("COMPETITION_WATERMARK_COLUMN", "updated_at")
+# ETag 버전을 추적할 목록 테이블 (워터마크를 COMPETITION_WATERMARK_POLL_SECONDS마다 확인, 워터마크 컬럼이 없으면 ETag 미사용)
+LISTING_VERSIONED_TABLES = ("sport_clubs", "public_sport_programs")
+# 메모리 스냅샷 + 필터 역색인으로 응답할 목록 테이블 (쉼표 구분, 비우면 매 요청 DB 조회). 갱신 주기는 대회 스냅샷과 같음
+LISTING_SNAPSHOT_TABLES = tuple(t.strip() for t in os.getenv("LISTING_SNAPSHOT_TABLES", ",".join(LISTING_VERSIONED_TABLES)).split(",") if t.strip())
+
+# 증분 동기화: 스냅샷 이후 워터마크 컬럼 값이 바뀐 행만 받아 반영 (소프트 삭제 컬럼 값이 있는 행은 삭제로 처리, 하드 삭제는
+# 행 수 불일치로 감지해 전체 재적재). 증분 동기화가 가능한 테이블은 전체 재적재를 SYNC_FULL_RELOAD_SECONDS마다 안전망으로만 수행
+SYNC_DELETED_COLUMN = os.getenv("SYNC_DELETED_COLUMN", "deleted_at")
+SYNC_FULL_RELOAD_SECONDS = int(os.getenv("SYNC_FULL_RELOAD_SECONDS", "21600"))
+
+# 게시글 조회수 write-behind: 증가분을 모아 반영하는 주기(초)와 원자적 증가 RPC 이름 (함수 정의: migrations/001_increment_team_board_views.sql)
+TEAM_BOARD_VIEWS_FLUSH_SECONDS = float(os.getenv("TEAM_BOARD_VIEWS_FLUSH_SECONDS", "5"))
+TEAM_BOARD_VIEWS_RPC = os.getenv("TEAM_BOARD_VIEWS_RPC", "increment_team_board_views")
+
+# 추천 일괄 계산: 한 번에 계산할 사용자 수(사용자 × 대회 행렬의 행 수), 사전 계산할 종목별 추천 수, 결과 보관 시간(초)/개수
+RECOMMEND_BATCH_CHUNK_USERS = int(os.getenv("RECOMMEND_BATCH_CHUNK_USERS", "64"))
+RECOMMEND_PRECOMPUTE_TOP_N = int(os.getenv("RECOMMEND_PRECOMPUTE_TOP_N", "3"))
+RECOMMEND_PRECOMPUTE_TTL_SECONDS = int(os.getenv("RECOMMEND_PRECOMPUTE_TTL_SECONDS", "21600"))
+RECOMMEND_PRECOMPUTE_CACHE_SIZE = int(os.getenv("RECOMMEND_PRECOMPUTE_CACHE_SIZE", "100000"))
+# 설정하면 사전 계산 결과를 이 테이블에도 저장/조회 (배치 작업 프로세스와 API 서버가 결과를 공유)
+# 컬럼: user_id(PK), profile_hash, watermark, available_from, top_n, computed_at, recommended_by_sport(jsonb)
+RECOMMENDATION_RESULTS_TABLE = os.getenv("RECOMMENDATION_RESULTS_TABLE")
+# 추천 결과 캐시 (사용자, 프로필, 대회 스냅샷, top_n, 날짜가 같으면 재사용): 메모리 최대 개수 / 보관 시간(초)
+# RECOMMEND_RESULT_CACHE_PATH를 지정하면 SQLite 파일에도 저장해 재시작 후에도 재사용
+RECOMMEND_RESULT_CACHE_SIZE = int(os.getenv("RECOMMEND_RESULT_CACHE_SIZE", "10000"))
+RECOMMEND_RESULT_CACHE_TTL_SECONDS = int(os.getenv("RECOMMEND_RESULT_CACHE_TTL_SECONDS", "3600"))
+RECOMMEND_RESULT_CACHE_PATH = os.getenv("RECOMMEND_RESULT_CACHE_PATH")
+SUPABASE_IN_FILTER_CHUNK = 100  # in_ 필터 한 번에 넣을 값 수 (URL 길이 제한)
+
 # ====================================================
 # FastAPI 앱 및 Supabase 클라이언트 초기화
 # ====================================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 대회 스냅샷은 백그라운드에서 적재/갱신 (서버 기동을 막지 않음)
+    refresh_task = asyncio.create_task(competition_refresh_loop()) if supabase else None
+    views_task = asyncio.create_task(view_count_flush_loop()) if supabase else None
+    versions_task = asyncio.create_task(table_version_loop()) if supabase else None
+    yield
+    if refresh_task:
+        refresh_task.cancel()
+    if versions_task:
+        versions_task.cancel()
+    if views_task:
+        views_task.cancel()
+        await flush_view_counts()  # 종료 전에 남은 조회수 반영
+    _db_executor.shutdown(wait=False)
+
 app = FastAPI(
     title="Sports Competition API (V2.3 - Edit/Delete)",
     description="운동 대회 검색, AI 추천, 게시판 API (수정/삭제 기능 추가)",
-    version="2.3.0"
+    version="2.3.0",
+    lifespan=lifespan
 )
 
 # 익명 클라이언트 (공개 데이터 조회용)
@@ -51,6 +147,14 @@ if supabase_url and supabase_key:
     except Exception as e:
         print(f"⚠️ Supabase 익명 클라이언트 연결 실패: {e}")
 
+# 서비스 클라이언트 (내부 일괄 작업 전용, 사용자 요청 처리에는 사용하지 않음)
+supabase_service: Optional[Client] = None
+if supabase_url and supabase_service_key:
+    try:
+        supabase_service = create_client(supabase_url, supabase_service_key)
+    except Exception as e:
+        print(f"⚠️ Supabase 서비스 클라이언트 연결 실패: {e}")
+
 # ====================================================
 # Pydantic 모델
 # ====================================================
@@ -78,6 +182,11 @@ class ReplyCreate(BaseModel):
     parent_id: Optional[int] = None
     is_application: bool = False
 
+class RecommendBatchRequest(BaseModel):
+    user_ids: Optional[List[str]] = None  # None이면 전체 사용자
+    top_n: int = RECOMMEND_PRECOMPUTE_TOP_N
+    include_results: bool = True
+
 class SportCategory(str, Enum):
     배드민턴 = "배드민턴"
     마라톤 = "마라톤"
@@ -101,21 +210,145 @@ GRADE_SKILL_MAP: Dict[SportCategory, Dict[str, List[str]]] = {
     },
 }
 
+# ====================================================
+# 캐시
+# ====================================================
+
+class TTLCache:
+    """최대 크기(LRU 제거)와 항목별 만료 시각을 갖는 스레드 안전 캐시. 적중률 통계를 함께 기록"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.hits = self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None: del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        with self._lock: self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+class SQLiteCacheStore:
+    """TTLCache 뒤에 두는 디스크 저장소. 값은 JSON으로 저장하며 만료된 행은 열 때와 주기적으로 삭제"""
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.prune()
+
+    def get(self, key: str) -> Any:
+        with self._lock: row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time(): return None
+        return json.loads(row[0]), row[1] - time.time()
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, encoded, time.time() + ttl))
+            self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0: self.prune()
+
+    def prune(self) -> None:
+        with self._lock: self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+class TieredCache:
+    """메모리 LRU(TTLCache) + 선택적 SQLite 저장소. 메모리에 없으면 디스크에서 읽어 남은 TTL만큼 다시 올린다"""
+
+    def __init__(self, maxsize: int, ttl: float, path: Optional[str] = None):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk: Optional[SQLiteCacheStore] = None
+        self.disk_hits = 0
+        if path:
+            try: self.disk = SQLiteCacheStore(path)
+            except sqlite3.Error as e: print(f"⚠️ 디스크 캐시 열기 실패 ({path}): {e}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None: return default if value is None else value
+        try: found = self.disk.get(key)
+        except sqlite3.Error as e:
+            print(f"⚠️ 디스크 캐시 조회 실패: {e}")
+            return default
+        if found is None: return default
+        value, ttl = found
+        self.disk_hits += 1
+        self.memory.set(key, value, ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.memory.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl)
+        if self.disk is None: return
+        try: self.disk.set(key, value, ttl)
+        except sqlite3.Error as e: print(f"⚠️ 디스크 캐시 저장 실패: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.memory.stats(), "disk": self.disk is not None, "disk_hits": self.disk_hits}
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
 # ====================================================
 # 인증
 # ====================================================
 
 security = HTTPBearer()
 
+_authed_client_cache = TTLCache(maxsize=AUTHED_CLIENT_CACHE_SIZE, ttl=AUTHED_CLIENT_TTL_SECONDS)
+
 def get_authed_supabase_client(token: str) -> Client:
+    # 같은 토큰이면 클라이언트(와 그 HTTP 커넥션 풀)를 재사용. 토큰이 만료되면 캐시에서도 만료
     if not supabase_url or not supabase_key: raise HTTPException(503, "Supabase 설정 없음")
-    return create_client(supabase_url, supabase_key, options=ClientOptions(headers={"Authorization": f"Bearer {token}"}))
+    key = token_digest(token)
+    client = _authed_client_cache.get(key)
+    if client is not None: return client
+    client = create_client(supabase_url, supabase_key, options=ClientOptions(headers={"Authorization": f"Bearer {token}"}))
+    try: exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError: exp = None
+    ttl = AUTHED_CLIENT_TTL_SECONDS if exp is None else min(AUTHED_CLIENT_TTL_SECONDS, exp - time.time())
+    if ttl > 0: _authed_client_cache.set(key, client, ttl)
+    return client
+
+_jwt_cache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL_SECONDS)
 
 async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     token = credentials.credentials
     
     if not supabase_jwt_secret: 
         raise HTTPException(500, "JWT 시크릿 설정 없음")
+
+    # 캐시 값: (user_id, None) 검증 성공 / (None, 오류 메시지) 검증 실패
+    key = token_digest(token)
+    cached = _jwt_cache.get(key)
+    if cached is not None:
+        user_id, error = cached
+        if error: raise HTTPException(401, error)
+        return user_id
         
     try:
         payload = jwt.decode(
@@ -128,67 +361,366 @@ async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depend
         user_id = payload.get("sub")
         if not user_id: 
             raise HTTPException(401, "유효하지 않은 토큰 (ID 없음)")
-            
+
+        # 성공 결과는 토큰 exp 시각까지만 보관
+        exp = payload.get("exp")
+        ttl = JWT_CACHE_TTL_SECONDS if exp is None else min(JWT_CACHE_TTL_SECONDS, exp - time.time())
+        if ttl > 0: _jwt_cache.set(key, (user_id, None), ttl)
         return user_id
         
     except jwt.ExpiredSignatureError: 
+        _jwt_cache.set(key, (None, "토큰 만료"), JWT_NEGATIVE_CACHE_TTL_SECONDS)
         raise HTTPException(401, "토큰 만료")
     except (jwt.PyJWTError, Exception) as e:
         print(f"DEBUG Error: {e}")
+        _jwt_cache.set(key, (None, "유효하지 않은 토큰"), JWT_NEGATIVE_CACHE_TTL_SECONDS)
         raise HTTPException(401, "유효하지 않은 토큰")
 
+def require_internal_token(x_internal_token: Optional[str] = Header(None)) -> None:
+    # 내부 호출 전용 엔드포인트(스케줄러/운영 도구/모니터링): 사용자 토큰 대신 INTERNAL_API_TOKEN으로 인증
+    if not internal_api_token or not x_internal_token or not hmac.compare_digest(x_internal_token, internal_api_token): raise HTTPException(403, "내부 호출 권한 없음")
+
 # ====================================================
 # 유틸리티 함수
 # ====================================================
-async def fetch_paginated_data(base_query: Any) -> List[Dict[str, Any]]:
-    all_data = []
-    offset = 0
-    while True:
-        try:
-            response = base_query.range(offset, offset + SUPABASE_PAGE_SIZE - 1).execute()
-            all_data.extend(response.data)
-            if len(response.data) < SUPABASE_PAGE_SIZE: break
-            offset += SUPABASE_PAGE_SIZE
-        except: break
-    return all_data
-
-def process_competition_data(item: Dict[str, Any], available_from: Optional[str] = None) -> Optional[Dict[str, Any]]:
-    if available_from and item.get('event_period'):
+# supabase-py는 동기 클라이언트이므로 모든 .execute()는 이 풀에서 실행해 이벤트 루프를 막지 않는다
+_db_executor = ThreadPoolExecutor(max_workers=SUPABASE_DB_POOL_SIZE, thread_name_prefix="supabase-db")
+
+async def run_db(query: Any) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, query.execute)
+
+async def execute_with_retry(build_query: Callable[[], Any]) -> Any:
+    for attempt in range(SUPABASE_FETCH_RETRIES + 1):
         try:
-            if item['event_period'].split(',')[0].replace('[', '').strip() < available_from: return None
-        except: pass
-    if item.get('location'):
+            return await run_db(build_query())
+        except Exception as e:
+            if attempt == SUPABASE_FETCH_RETRIES: raise
+            print(f"⚠️ Supabase 조회 실패, 재시도 {attempt + 1}/{SUPABASE_FETCH_RETRIES}: {e}")
+            await asyncio.sleep(SUPABASE_RETRY_BACKOFF_SECONDS * 2**attempt)
+
+async def fetch_paginated_data(query_factory: Callable[..., Any], count: Optional[str] = None) -> List[Dict[str, Any]]:
+    """query_factory는 호출마다 새 쿼리 빌더를 반환해야 함 (range()가 빌더를 변경하므로 페이지 간 재사용 불가).
+    count를 지정하면 첫 페이지만 query_factory(count=count)로 전체 건수를 함께 요청하고 (페이지마다 COUNT(*)를 돌리지 않음)
+    나머지 페이지를 한 번에, 건수가 없으면 SUPABASE_FETCH_CONCURRENCY개씩 미리 조회하며 결과는 페이지 순서대로 이어 붙인다."""
+    semaphore = asyncio.Semaphore(SUPABASE_FETCH_CONCURRENCY)
+
+    async def fetch_page(offset: int, count: Optional[str] = None) -> Any:
+        async with semaphore:
+            return await execute_with_retry(lambda: (query_factory(count=count) if count else query_factory()).range(offset, offset + SUPABASE_PAGE_SIZE - 1))
+
+    first = await fetch_page(0, count)
+    all_data = list(first.data)
+    if len(first.data) < SUPABASE_PAGE_SIZE: return all_data
+
+    if first.count is not None:
+        offsets = list(range(SUPABASE_PAGE_SIZE, first.count, SUPABASE_PAGE_SIZE))
+        for res in await asyncio.gather(*(fetch_page(o) for o in offsets)):
+            all_data.extend(res.data)
+        return all_data
+
+    offset = SUPABASE_PAGE_SIZE
+    while True:
+        offsets = [offset + k * SUPABASE_PAGE_SIZE for k in range(SUPABASE_FETCH_CONCURRENCY)]
+        for res in await asyncio.gather(*(fetch_page(o) for o in offsets)):
+            all_data.extend(res.data)
+            if len(res.data) < SUPABASE_PAGE_SIZE: return all_data
+        offset = offsets[-1] + SUPABASE_PAGE_SIZE
+
+async def iter_paginated_data(query_factory: Callable[[], Any]):
+    """fetch_paginated_data의 스트리밍 버전. 페이지가 도착하는 대로 순서대로 내보내고, 그동안 다음 페이지를 미리 요청"""
+    def page(offset: int) -> Callable[[], Any]:
+        return lambda: query_factory().range(offset, offset + SUPABASE_PAGE_SIZE - 1)
+
+    offset = 0
+    next_page = asyncio.ensure_future(execute_with_retry(page(offset)))
+    try:
+        while True:
+            res = await next_page
+            has_more = len(res.data) >= SUPABASE_PAGE_SIZE
+            if has_more:
+                offset += SUPABASE_PAGE_SIZE
+                next_page = asyncio.ensure_future(execute_with_retry(page(offset)))
+            yield res.data
+            if not has_more: return
+    finally:
+        next_page.cancel()
+
+def region_query_factory(table: str, sport_category: Optional[str], province: Optional[str], city_county: Optional[str], count: Optional[str] = None, deleted_column: Optional[str] = None) -> Callable[[], Any]:
+    # count를 지정하면 행 없이 건수만 조회하는 쿼리 (HEAD 요청), deleted_column을 지정하면 소프트 삭제된 행 제외
+    def build_query() -> Any:
+        query = supabase.table(table).select("*", count=count, head=True) if count else supabase.table(table).select("*")
+        if deleted_column: query = query.is_(deleted_column, "null")
+        if sport_category and sport_category != '전체 종목': query = query.eq("sport_category", sport_category)
+        if province and province != '전체 지역': 
+            query = query.eq("location_province_city", province)
+            if city_county and city_county != '전체 시/군/구': query = query.eq("location_county_district", city_county)
+        return query.order("id")
+    return build_query
+
+async def fetch_keyset_page(query_factory: Callable[[], Any], count_query_factory: Callable[[], Any], limit: int, cursor: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[int]]:
+    """id 기준 키셋 페이지 조회. (행 목록, 전체 건수, 다음 커서)를 반환하며 다음 페이지가 없으면 커서는 None"""
+    def build_page() -> Any:
+        query = query_factory()
+        if cursor is not None: query = query.gt("id", cursor)
+        return query.limit(limit + 1)
+    page_res, count_res = await asyncio.gather(execute_with_retry(build_page), execute_with_retry(count_query_factory))
+    rows = page_res.data[:limit]
+    next_cursor = rows[-1]["id"] if len(page_res.data) > limit else None
+    return rows, count_res.count, next_cursor
+
+def wants_ndjson(stream: bool, accept: Optional[str]) -> bool:
+    return stream or (accept is not None and NDJSON_MEDIA_TYPE in accept)
+
+def json_bytes(value: Any) -> bytes:
+    if orjson is not None: return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """orjson(없으면 표준 json)으로 직렬화하는 응답. 엔드포인트가 직접 반환하면 response_model 검증/인코딩을 거치지 않으므로
+    DB 행이나 이미 JSON 호환인 값에만 사용"""
+    def render(self, content: Any) -> bytes:
+        return json_bytes(content)
+
+def prejson_response(fields: Dict[str, Any], rows_json: List[bytes]) -> Response:
+    # 미리 직렬화된 행을 이어 붙여 {**fields, "data": [...]} 응답을 만든다 (행을 다시 직렬화하지 않음)
+    head = json_bytes(fields)[:-1] + (b',"data":[' if fields else b'"data":[')
+    return Response(head + b",".join(rows_json) + b"]}", media_type="application/json")
+
+def normalize_region_filters(sport_category: Optional[str], province: Optional[str], city_county: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    # '전체' 선택과 빈 값은 필터 없음과 같고, 시/군/구는 시/도가 지정된 경우에만 의미가 있음 (region_query_factory와 같은 규칙)
+    sport_category = None if not sport_category or sport_category == '전체 종목' else sport_category
+    province = None if not province or province == '전체 지역' else province
+    city_county = None if not province or not city_county or city_county == '전체 시/군/구' else city_county
+    return sport_category, province, city_county
+
+def listing_etag(version: Optional[str], **params: Any) -> Optional[str]:
+    """데이터 버전 + 정규화된 요청 파라미터로 만든 강한 ETag. 버전을 모르면 None (ETag 없이 응답)"""
+    if version is None: return None
+    normalized = sorted((k, str(v)) for k, v in params.items() if v is not None and v != "")
+    return '"' + hashlib.sha256(json.dumps([version, normalized], ensure_ascii=False).encode()).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    # If-None-Match는 약한 비교 (W/ 접두어 무시), '*'는 항상 일치
+    if not if_none_match or not etag: return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in tags)
+
+def with_etag(response: Response, etag: Optional[str]) -> Response:
+    # 클라이언트가 매번 재검증하도록 no-cache와 함께 전송 (목록은 Accept에 따라 NDJSON으로도 응답하므로 Vary 지정)
+    if etag: response.headers["ETag"], response.headers["Cache-Control"], response.headers["Vary"] = etag, "no-cache", "Accept"
+    return response
+
+def not_modified(etag: str) -> Response:
+    return with_etag(Response(status_code=304), etag)
+
+class SingleFlight:
+    """같은 키로 동시에 들어온 비동기 작업을 하나로 합친다. 진행 중인 작업이 있으면 새로 실행하지 않고 그 결과(또는 예외)를
+    함께 받으며, 먼저 요청한 클라이언트가 연결을 끊어도 작업은 끝까지 실행된다. 결과는 공유되므로 읽기 전용으로 다룬다"""
+
+    def __init__(self):
+        self._inflight: Dict[Any, "asyncio.Future[Any]"] = {}
+        self.calls = self.shared = 0
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._inflight[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": len(self._inflight), "calls": self.calls, "shared": self.shared}
+
+_single_flight = SingleFlight()
+
+async def coalesced_json_response(key: Tuple[Any, ...], build_payload: Callable[[], Awaitable[Dict[str, Any]]]) -> Response:
+    # 같은 조건의 동시 요청은 DB 조회와 직렬화를 한 번만 하고 본문(bytes)을 공유
+    async def build_body() -> bytes: return json_bytes(await build_payload())
+    return Response(await _single_flight.do(key, build_body), media_type="application/json")
+
+def ndjson_line(row: Dict[str, Any]) -> str:
+    return json.dumps(row, ensure_ascii=False, default=str) + "\n"
+
+def ndjson_rows(rows) -> StreamingResponse:
+    # 메모리의 행을 NDJSON_CHUNK_ROWS개씩 묶어 전송
+    def chunks():
+        buffer: List[str] = []
+        for row in rows:
+            buffer.append(ndjson_line(row))
+            if len(buffer) >= NDJSON_CHUNK_ROWS:
+                yield "".join(buffer); buffer = []
+        if buffer: yield "".join(buffer)
+    return StreamingResponse(chunks(), media_type=NDJSON_MEDIA_TYPE)
+
+def ndjson_pages(pages) -> StreamingResponse:
+    # Supabase 페이지 단위로 받는 즉시 전송 (서버 메모리에는 한 페이지만 유지)
+    async def chunks():
+        async for page in pages:
+            if page: yield "".join(ndjson_line(row) for row in page)
+    return StreamingResponse(chunks(), media_type=NDJSON_MEDIA_TYPE)
+
+class CompetitionRecord(NamedTuple):
+    """적재 시 한 번만 계산한 대회 특성 (불변). row는 응답용 dict로 요청 간 공유되므로 읽기 전용으로 다룬다"""
+    id: Any
+    title: Optional[str]
+    sport_category: Optional[str]
+    province: Optional[str]
+    county: Optional[str]
+    start_date: Optional[str]
+    start_ordinal: int
+    latitude: Optional[float]
+    longitude: Optional[float]
+    skill_rank: int
+    age_range: Tuple[int, int, str]
+    gender: Optional[str]  # None: 성별 무관
+    row: Dict[str, Any]
+    row_json: bytes  # row를 미리 직렬화한 JSON (목록 응답에 그대로 사용)
+
+WKB_SRID_FLAG, WKB_Z_FLAG, WKB_M_FLAG = 0x20000000, 0x80000000, 0x40000000
+WKB_POINT = 1
+
+WKB_XY = {'<': struct.Struct('<dd'), '>': struct.Struct('>dd')}
+
+@lru_cache(maxsize=64)
+def wkb_point_layout(header_hex: str) -> Optional[Tuple[str, int, int]]:
+    """(E)WKB 앞 5바이트(바이트 순서 + 타입, 16진 10자)로 POINT의 (바이트 순서, 좌표 시작 위치, 전체 길이)를 계산.
+    POINT가 아니면 None. 행마다 헤더가 거의 같으므로 캐시"""
+    try: header = bytes.fromhex(header_hex)
+    except ValueError: return None
+    if len(header) != 5 or header[0] not in (0, 1): return None
+    order = '<' if header[0] == 1 else '>'
+    (geom_type,) = struct.unpack_from(order + 'I', header, 1)
+    base = geom_type & 0x0FFFFFFF
+    if base % 1000 != WKB_POINT or base // 1000 > 3: return None
+    # 좌표 차원: EWKB는 Z/M 플래그, ISO WKB는 1001(Z)/2001(M)/3001(ZM)
+    dims = 2 + bool(geom_type & WKB_Z_FLAG) + bool(geom_type & WKB_M_FLAG) + (0, 1, 1, 2)[base // 1000]
+    offset = 9 if geom_type & WKB_SRID_FLAG else 5
+    return order, offset, offset + 8 * dims
+
+def decode_wkb_point(location_hex: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    # shapely 없이 POINT의 (x, y)만 읽음. POINT가 아니거나 길이가 맞지 않으면 None (shapely로 처리)
+    layout = wkb_point_layout(location_hex[:10])
+    if layout is None or len(location_hex) != 2 * layout[2]: return None
+    x, y = WKB_XY[layout[0]].unpack(bytes.fromhex(location_hex[2 * layout[1]:2 * layout[1] + 32]))
+    return (None, None) if math.isnan(x) or math.isnan(y) else (x, y)  # NaN 좌표는 POINT EMPTY
+
+def decode_location(location_hex: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    # WKB 16진 문자열 -> (x, y). 값이 없거나 해석할 수 없으면 (None, None)
+    if not location_hex: return None, None
+    try:
+        point = decode_wkb_point(location_hex)
+        if point is not None: return point
+        from shapely import wkb  # POINT가 아닌 도형에만 필요하므로 지연 import
+        geom = wkb.loads(bytes.fromhex(location_hex))
+        return geom.x, geom.y
+    except Exception: return None, None
+
+def decode_locations(location_hexes: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """decode_location의 일괄 버전. 길이가 같은 값끼리 이어 붙여 한 번에 바이트로 바꾸고, 헤더가 같은 POINT 묶음은
+    NumPy 뷰로 좌표를 읽는다. 그 외(다른 도형, 잘못된 값)는 한 건씩 처리. 값이 없으면 NaN"""
+    n = len(location_hexes)
+    xs, ys = np.full(n, np.nan), np.full(n, np.nan)
+
+    def decode_each(ids: np.ndarray) -> None:
+        for i in ids.tolist():
+            x, y = decode_location(location_hexes[i])
+            if x is not None: xs[i], ys[i] = x, y
+
+    values = np.array(location_hexes, dtype=object)
+    present = np.flatnonzero(values.astype(bool))
+    values = values[present]
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    for length in np.unique(lengths).tolist():
+        same_length = lengths == length
+        ids = present[same_length]
         try:
-            geom = wkb.loads(unhexlify(item['location']))
-            item['longitude'] = geom.x; item['latitude'] = geom.y
-        except: item['longitude'] = None; item['latitude'] = None
-    else: item['longitude'] = None; item['latitude'] = None
-    if item.get('event_period'): item['start_date'] = item.pop('event_period', '').split(',')[0].replace('[', '').strip()
-    else: item['start_date'] = None
-    item.pop('location', None)
-    return item
+            if length % 2 or length < 10: raise ValueError("일괄 처리 불가")
+            raw = np.frombuffer(bytes.fromhex("".join(values[same_length])), dtype=np.uint8).reshape(len(ids), length // 2)
+        except ValueError:
+            decode_each(ids); continue
+        headers, group_of = np.unique(np.ascontiguousarray(raw[:, :5]).view("V5").ravel(), return_inverse=True)
+        for g, header in enumerate(headers):
+            in_group = group_of.ravel() == g
+            layout = wkb_point_layout(header.tobytes().hex())
+            if layout is None or layout[2] != length // 2:
+                decode_each(ids[in_group]); continue
+            order, offset, _ = layout
+            coords = np.ascontiguousarray(raw[in_group, offset:offset + 16]).view(order + "f8")
+            xs[ids[in_group]], ys[ids[in_group]] = coords[:, 0], coords[:, 1]
+    empty = np.isnan(xs) | np.isnan(ys)
+    xs[empty] = ys[empty] = np.nan
+    return xs, ys
 
+def ingest_competition(item: Dict[str, Any], point: Optional[Tuple[Optional[float], Optional[float]]] = None) -> CompetitionRecord:
+    """DB 원본 행을 CompetitionRecord로 변환. 원본은 변경하지 않으며 응답 형태(row)는 기존과 같다
+    (location/event_period 제거, longitude/latitude/start_date 추가). point는 미리 해석한 location (x, y)"""
+    event_period = item.get('event_period')
+    start_date = event_period.split(',')[0].replace('[', '').strip() if event_period else None
+    longitude, latitude = point if point is not None else decode_location(item.get('location'))
+    row = {k: v for k, v in item.items() if k != 'location' and not (k == 'event_period' and event_period)}
+    row['longitude'] = longitude; row['latitude'] = latitude; row['start_date'] = start_date
+    sport = item.get("sport_category")
+    gender = item.get("gender")
+    return CompetitionRecord(
+        id=item.get("id"), title=item.get("title"), sport_category=sport,
+        province=item.get("location_province_city"), county=item.get("location_county_district"),
+        start_date=start_date, start_ordinal=start_date_ordinal(start_date),
+        latitude=latitude, longitude=longitude,
+        skill_rank=SKILL_RANK.get(get_skill_level_from_grade(sport, item.get("grade")), 0),
+        age_range=parse_age_range(item.get("age")),
+        gender=gender.strip() if gender and gender != "무관" else None,
+        row=row, row_json=json_bytes(row),
+    )
+
+def ingest_competitions(items: List[Dict[str, Any]]) -> List[CompetitionRecord]:
+    # location 컬럼 전체를 한 번에 해석한 뒤 레코드로 변환
+    xs, ys = decode_locations([item.get('location') for item in items])
+    points = [(None, None) if math.isnan(x) else (x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+    return [ingest_competition(item, point) for item, point in zip(items, points)]
+
+def build_grade_skill_index() -> Dict[str, Dict[str, str]]:
+    """GRADE_SKILL_MAP을 종목별 {정규화된 등급: 실력} 사전으로 변환 (먼저 나온 실력 수준이 우선)"""
+    index: Dict[str, Dict[str, str]] = {}
+    for sport_enum, mapping in GRADE_SKILL_MAP.items():
+        sport_index = index.setdefault(sport_enum.value, {})
+        for skill_level, grades in mapping.items():
+            for g in grades: sport_index.setdefault(g.upper().replace(' ', ''), skill_level)
+    return index
+
+GRADE_SKILL_INDEX = build_grade_skill_index()
+
+@lru_cache(maxsize=4096)
 def get_skill_level_from_grade(sport: str, grade: Optional[str]) -> str:
     grade = grade.strip().replace(' ', '') if grade else ""
     if not grade: return "무관"
-    try: sport_enum = SportCategory(sport)
-    except ValueError: return "무관"
-    mapping = GRADE_SKILL_MAP.get(sport_enum, {})
-    normalized_grade = grade.upper().replace(' ', '')
-    for skill_level, grades in mapping.items():
-        if normalized_grade in [g.upper().replace(' ', '') for g in grades]: return skill_level
-    return "무관"
+    sport_index = GRADE_SKILL_INDEX.get(sport)
+    if sport_index is None: return "무관"
+    return sport_index.get(grade.upper(), "무관")
 
-def age_matches(user_age: int, competition_age_str: Optional[str]) -> bool:
-    if not competition_age_str or competition_age_str == "무관": return True
+AGE_MIN, AGE_MAX = -(2**62), 2**62
+AGE_ANY = (AGE_MIN, AGE_MAX, "any")
+AGE_UNPARSABLE = (1, 0, "invalid")  # lo <= age < hi 를 만족하는 나이가 없음
+
+@lru_cache(maxsize=1024)
+def parse_age_range(competition_age_str: Optional[str]) -> Tuple[int, int, str]:
+    """대회 나이 조건 문자열("20~39세", "~19세", "40~", "30")을 (lo, hi, kind)로 변환. 조건은 lo <= 나이 < hi"""
+    if not competition_age_str or competition_age_str == "무관": return AGE_ANY
+    if not isinstance(competition_age_str, str): return AGE_UNPARSABLE
+    age_str = competition_age_str.replace(' ', '').replace('세', '')
     try:
-        age_str = competition_age_str.replace(' ', '').replace('세', '')
-        if '~' not in age_str: return user_age == int(age_str)
-        elif age_str.startswith('~'): return user_age < int(age_str[1:])
-        elif age_str.endswith('~'): return user_age >= int(age_str[:-1])
+        if '~' not in age_str: return int(age_str), int(age_str) + 1, "exact"
+        elif age_str.startswith('~'): return AGE_MIN, int(age_str[1:]), "below"
+        elif age_str.endswith('~'): return int(age_str[:-1]), AGE_MAX, "from"
         else:
-            min_str, max_str = age_str.split('~'); return int(min_str) <= user_age < int(max_str)
-    except: return False
+            min_str, max_str = age_str.split('~'); return int(min_str), int(max_str), "range"
+    except ValueError: return AGE_UNPARSABLE
+
+def age_matches(user_age: int, competition_age_str: Optional[str]) -> bool:
+    lo, hi, _ = parse_age_range(competition_age_str)
+    return lo <= user_age < hi
 
 def gender_matches(user_gender: Optional[str], competition_gender: Optional[str]) -> bool:
     if not competition_gender or competition_gender == "무관": return True
@@ -230,6 +762,786 @@ def calculate_recommendation_score(user_profile: Dict[str, Any], competition: Di
     return (SKILL_WEIGHT * skill_score) + (LOCATION_WEIGHT * location_score), skill_score, location_score
 
 
+# ====================================================
+# 추천 엔진 (NumPy 컬럼형 일괄 계산)
+# ====================================================
+
+DATE_ORDINAL_MIN, DATE_ORDINAL_MAX = -(2**62), 2**62
+
+def start_date_ordinal(start_date: Optional[str]) -> int:
+    # 날짜가 없으면 항상 통과, 파싱 불가 문자열은 ISO 날짜와의 문자열 비교 결과를 따름
+    if start_date is None: return DATE_ORDINAL_MAX
+    try: return datetime.date.fromisoformat(start_date).toordinal()
+    except ValueError: return DATE_ORDINAL_MIN if start_date < "0" else DATE_ORDINAL_MAX
+
+class SpatialGridIndex:
+    """위경도 격자 버킷 인덱스. 반경 질의는 반경을 덮는 셀들의 행 번호(상위 집합)를 돌려주며, 정확한 거리 판정은 호출자가 한다"""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_deg: float = SPATIAL_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.n_rows, self.n_cols = math.ceil(180 / cell_deg) + 1, math.ceil(360 / cell_deg)
+        self.all_ids = np.flatnonzero(~np.isnan(lat))
+        keys = self._cell_y(lat[self.all_ids]) * self.n_cols + self._cell_x(lon[self.all_ids])
+        order = np.argsort(keys, kind="stable")
+        cell_keys, starts = np.unique(keys[order], return_index=True)
+        self.cells: Dict[int, np.ndarray] = dict(zip(cell_keys.tolist(), np.split(self.all_ids[order], starts[1:])))
+
+    def _cell_y(self, lat: Any) -> Any:
+        return np.floor((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64)
+
+    def _cell_x(self, lon: Any) -> Any:
+        return np.floor(((np.asarray(lon) + 180) % 360) / self.cell_deg).astype(np.int64)
+
+    def query(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        delta = radius_km / EARTH_RADIUS_KM  # 중심각(라디안)
+        margin = 1e-9
+        lat_lo, lat_hi = lat - math.degrees(delta) - margin, lat + math.degrees(delta) + margin
+        y_lo, y_hi = max(int(self._cell_y(max(lat_lo, -90.0))), 0), min(int(self._cell_y(min(lat_hi, 90.0))), self.n_rows - 1)
+        # 극을 포함하지 않으면 반경 내 점의 최대 경도 차는 asin(sin δ / cos φ)
+        if lat_lo <= -90 or lat_hi >= 90 or math.sin(delta) >= math.cos(math.radians(lat)):
+            xs = range(self.n_cols)
+        else:
+            dlon = math.degrees(math.asin(math.sin(delta) / math.cos(math.radians(lat)))) + margin
+            x_lo, x_hi = int(math.floor((lon - dlon + 180) / self.cell_deg)), int(math.floor((lon + dlon + 180) / self.cell_deg))
+            xs = range(self.n_cols) if x_hi - x_lo + 1 >= self.n_cols else [x % self.n_cols for x in range(x_lo, x_hi + 1)]
+        found = [ids for y in range(y_lo, y_hi + 1) for x in xs if (ids := self.cells.get(y * self.n_cols + x)) is not None]
+        return np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+def top_n_by_title(sport: np.ndarray, title: np.ndarray, score: np.ndarray, top_n: int) -> Dict[int, List[int]]:
+    """종목별로 제목당 최고 점수 후보를 남기고 점수 상위 top_n개를 정렬로 한 번에 선택.
+    동점이면 제목이 먼저 등장한 쪽, 같은 제목 안에서는 최고 점수를 처음 얻은 후보가 남아 dict에 모은 뒤 안정 정렬해 자르던 방식과 결과가 같다.
+    sport/title/score는 후보별 종목 코드, 제목 코드(-1: 제목 없음), 점수. 종목 코드 -> 선택된 후보 k 목록(점수 순)을 반환"""
+    k = np.flatnonzero(title >= 0)
+    if not len(k) or top_n <= 0: return {}
+    # (종목, 제목)별 대표: 최고 점수, 동점이면 먼저 나온 후보. 제목 간 동점은 제목이 처음 나온 순서로 정렬
+    order = np.lexsort((k, -score[k], title[k], sport[k]))
+    k = k[order]
+    s, t = sport[k], title[k]
+    heads = np.flatnonzero(np.r_[True, (s[1:] != s[:-1]) | (t[1:] != t[:-1])])
+    first_seen = np.minimum.reduceat(k, heads)
+    best, best_sport = k[heads], s[heads]
+    order = np.lexsort((first_seen, -score[best], best_sport))
+    best, best_sport = best[order], best_sport[order]
+    group_starts = np.flatnonzero(np.r_[True, best_sport[1:] != best_sport[:-1]])
+    rank = np.arange(len(best)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(best)]))
+    selected: Dict[int, List[int]] = {}
+    for code, pos in zip(best_sport[rank < top_n].tolist(), best[rank < top_n].tolist()): selected.setdefault(code, []).append(pos)
+    return selected
+
+class CompetitionMatrix:
+    """스냅샷 대회 목록의 컬럼형 표현. calculate_recommendation_score와 같은 점수를 전체 행에 대해 한 번에 계산"""
+
+    def __init__(self, records: List[CompetitionRecord]):
+        self.sport_codes: Dict[str, int] = {}
+        self.gender_codes: Dict[str, int] = {}
+        self.title_codes: Dict[str, int] = {}
+        for name, column in self._columns(records).items(): setattr(self, name, column)
+        self._derive()
+
+    def _columns(self, records: List[CompetitionRecord]) -> Dict[str, np.ndarray]:
+        # 레코드별 컬럼 값 (코드 사전은 이 행렬의 것을 사용/확장)
+        n = len(records)
+        sport = np.full(n, -1, dtype=np.int32)
+        gender = np.full(n, -1, dtype=np.int32)  # -1: 성별 무관
+        title = np.full(n, -1, dtype=np.int64)  # -1: 제목 없음 (추천 제외)
+        for i, record in enumerate(records):
+            if record.sport_category is not None: sport[i] = self.sport_codes.setdefault(record.sport_category, len(self.sport_codes))
+            if record.gender is not None: gender[i] = self.gender_codes.setdefault(record.gender, len(self.gender_codes))
+            if record.title: title[i] = self.title_codes.setdefault(record.title, len(self.title_codes))
+        return {
+            "sport": sport, "gender": gender, "title": title,
+            "skill_rank": np.fromiter((r.skill_rank for r in records), dtype=np.int8, count=n),
+            "age_lo": np.fromiter((r.age_range[0] for r in records), dtype=np.int64, count=n),
+            "age_hi": np.fromiter((r.age_range[1] for r in records), dtype=np.int64, count=n),
+            "start": np.fromiter((r.start_ordinal for r in records), dtype=np.int64, count=n),
+            "lat": np.fromiter((np.nan if r.latitude is None else r.latitude for r in records), dtype=np.float64, count=n),
+            "lon": np.fromiter((np.nan if r.longitude is None else r.longitude for r in records), dtype=np.float64, count=n),
+        }
+
+    def _derive(self) -> None:
+        self.has_location = ~np.isnan(self.lat)
+        self.lat_rad = np.radians(self.lat)
+        self.lon_rad = np.radians(self.lon)
+        self.cos_lat = np.cos(self.lat_rad)
+        self.spatial = SpatialGridIndex(self.lat, self.lon)
+
+    def updated(self, origin: np.ndarray, dirty_records: List[CompetitionRecord]) -> "CompetitionMatrix":
+        """행이 추가/수정/삭제된 새 행렬 (merge_by_id의 origin 기준, 이 행렬은 변경하지 않음).
+        dirty_records는 origin == -1인 행의 레코드(행 순서)이며 이 행들만 계산하고 나머지 행은 이전 배열에서 옮긴다"""
+        matrix = object.__new__(CompetitionMatrix)
+        matrix.sport_codes, matrix.gender_codes, matrix.title_codes = dict(self.sport_codes), dict(self.gender_codes), dict(self.title_codes)
+        for name, column in matrix._columns(dirty_records).items(): setattr(matrix, name, patch_rows(getattr(self, name), origin, column))
+        matrix._derive()
+        return matrix
+
+    def distances_from(self, lat: float, lon: float, rows: np.ndarray) -> np.ndarray:
+        """haversine_distance와 같은 식으로 (lat, lon)에서 각 행까지의 거리(km)를 계산"""
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        dlat, dlon = self.lat_rad[rows] - lat1, self.lon_rad[rows] - lon1
+        a = np.sin(dlat / 2)**2 + math.cos(lat1) * self.cos_lat[rows] * np.sin(dlon / 2)**2
+        return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    def nearby(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """반경 radius_km 안의 (행 번호, 거리)를 가까운 순으로 반환"""
+        candidates = self.spatial.query(lat, lon, radius_km)
+        distance = self.distances_from(lat, lon, candidates)
+        inside = distance <= radius_km
+        order = np.argsort(distance[inside], kind="stable")
+        return candidates[inside][order], distance[inside][order]
+
+    def score(self, user_profile: Dict[str, Any], available_from: datetime.date) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """점수가 0보다 큰 행의 (인덱스, 추천 점수, 실력 유사도, 위치 유사도)를 반환"""
+        empty = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0)
+        user_sports_map = {s['sport_name']: s['skill'] for s in user_profile.get('interesting_sports', [])}
+        user_age, user_gender = user_profile.get("age"), user_profile.get("gender")
+        if not user_age or not user_sports_map or not len(self.sport): return empty
+
+        # 종목 코드별 사용자 실력 순위 (-1: 관심 종목 아님)
+        user_rank_by_sport = np.full(len(self.sport_codes) + 1, -1, dtype=np.int8)
+        for sport_name, skill in user_sports_map.items():
+            if sport_name in self.sport_codes: user_rank_by_sport[self.sport_codes[sport_name]] = SKILL_RANK.get(skill, 0)
+        user_rank = user_rank_by_sport[self.sport]  # sport == -1 은 마지막 칸(-1)을 가리킴
+
+        user_gender = user_gender.strip() if user_gender else None
+        user_gender_code = self.gender_codes.get(user_gender, -2) if user_gender else -2
+        mask = (user_rank >= 0) & ((self.gender == -1) | (self.gender == user_gender_code))
+        mask &= (self.age_lo <= user_age) & (user_age < self.age_hi)
+        mask &= self.start >= available_from.toordinal()
+        idx = np.flatnonzero(mask)
+        if not len(idx): return empty
+
+        skill_score = np.maximum(0.0, 1.0 - (np.abs(user_rank[idx].astype(np.int64) - self.skill_rank[idx]) / 3.0))
+        location_score = np.full(len(idx), 0.5)
+        user_lat, user_lon = user_profile.get("user_latitude"), user_profile.get("user_longitude")
+        if user_lat is not None:
+            # 격자 색인으로 MAX_DIST_KM 안쪽만 고르지 않는다: 반경이 전국을 덮어 거의 모든 행이 남고 색인 조회 비용만 더해짐 (bench.py score_location)
+            located = self.has_location[idx]
+            distance = self.distances_from(user_lat, user_lon, idx[located])
+            location_score[located] = 1.0 - np.minimum(distance, MAX_DIST_KM) / MAX_DIST_KM
+        score = (SKILL_WEIGHT * skill_score) + (LOCATION_WEIGHT * location_score)
+        positive = score > 0
+        return idx[positive], score[positive], skill_score[positive], location_score[positive]
+
+    def score_many(self, user_profiles: List[Dict[str, Any]], available_from: datetime.date, chunk_users: int = RECOMMEND_BATCH_CHUNK_USERS):
+        """여러 사용자의 score() 결과를 사용자 순서대로 yield. chunk_users명씩 (사용자 × 대회) 행렬로 한 번에 계산"""
+        for start in range(0, len(user_profiles), chunk_users):
+            chunk = user_profiles[start:start + chunk_users]
+            u = len(chunk)
+            user_rank_by_sport = np.full((u, len(self.sport_codes) + 1), -1, dtype=np.int8)
+            user_gender_code = np.full(u, -2, dtype=np.int32)
+            user_age = np.zeros(u, dtype=np.int64)
+            active = np.zeros(u, dtype=bool)
+            user_lat, user_lon, user_cos_lat = np.full(u, np.nan), np.full(u, np.nan), np.full(u, np.nan)
+            for j, profile in enumerate(chunk):
+                user_sports_map = {s['sport_name']: s['skill'] for s in profile.get('interesting_sports', [])}
+                if not profile.get("age") or not user_sports_map: continue
+                active[j], user_age[j] = True, profile["age"]
+                for sport_name, skill in user_sports_map.items():
+                    if sport_name in self.sport_codes: user_rank_by_sport[j, self.sport_codes[sport_name]] = SKILL_RANK.get(skill, 0)
+                gender = profile.get("gender")
+                gender = gender.strip() if gender else None
+                if gender: user_gender_code[j] = self.gender_codes.get(gender, -2)
+                if profile.get("user_latitude") is not None:
+                    # distances_from과 같은 값이 나오도록 사용자 쪽 라디안/cos는 math로 계산
+                    user_lat[j], user_lon[j] = math.radians(profile["user_latitude"]), math.radians(profile["user_longitude"])
+                    user_cos_lat[j] = math.cos(user_lat[j])
+
+            user_rank = user_rank_by_sport[:, self.sport]
+            mask = active[:, None] & (user_rank >= 0) & ((self.gender == -1) | (self.gender == user_gender_code[:, None]))
+            mask &= (self.age_lo <= user_age[:, None]) & (user_age[:, None] < self.age_hi)
+            mask &= self.start >= available_from.toordinal()
+            # 점수는 조건을 통과한 (사용자, 대회) 칸에만 계산. 행 우선 순서라 사용자별 인덱스는 오름차순
+            users, idx = np.nonzero(mask)
+            skill_score = np.maximum(0.0, 1.0 - (np.abs(user_rank[users, idx].astype(np.int64) - self.skill_rank[idx]) / 3.0))
+            location_score = np.full(len(idx), 0.5)
+            located = ~np.isnan(user_lat[users]) & self.has_location[idx]
+            lu, li = users[located], idx[located]
+            dlat, dlon = self.lat_rad[li] - user_lat[lu], self.lon_rad[li] - user_lon[lu]
+            a = np.sin(dlat / 2)**2 + user_cos_lat[lu] * self.cos_lat[li] * np.sin(dlon / 2)**2
+            distance = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            location_score[located] = 1.0 - np.minimum(distance, MAX_DIST_KM) / MAX_DIST_KM
+            score = (SKILL_WEIGHT * skill_score) + (LOCATION_WEIGHT * location_score)
+            positive = score > 0
+            users, idx, score, skill_score, location_score = users[positive], idx[positive], score[positive], skill_score[positive], location_score[positive]
+            bounds = np.searchsorted(users, np.arange(u + 1)).tolist()
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                yield idx[lo:hi], score[lo:hi], skill_score[lo:hi], location_score[lo:hi]
+
+
+# ====================================================
+# 대회 스냅샷 캐시
+# ====================================================
+
+EMPTY_ROWS = np.empty(0, dtype=np.int64)
+EMPTY_ROWS.flags.writeable = False
+
+def intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # 오름차순·중복 없는 두 행 번호 배열의 교집합. 작은 쪽 원소를 큰 쪽에서 이진 탐색 (O(작은 쪽 × log 큰 쪽))
+    if len(a) > len(b): a, b = b, a
+    if not len(a) or not len(b): return EMPTY_ROWS
+    pos = np.searchsorted(b, a)
+    return a[b[np.minimum(pos, len(b) - 1)] == a]
+
+def merge_by_id(ids: np.ndarray, upsert_ids: Iterable[int], deleted_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """id 오름차순 행 집합에 변경분(추가/수정 id, 삭제 id)을 합친 새 (ids, origin)을 반환.
+    origin[i]는 새 i행이 그대로 옮겨 올 이전 행 번호이고, 추가/수정되어 새로 만들어야 하는 행은 -1"""
+    upserts = np.array(sorted(upsert_ids), dtype=np.int64)
+    kept = np.flatnonzero(~np.isin(ids, np.concatenate([upserts, np.fromiter(deleted_ids, dtype=np.int64)])))
+    merged_ids = np.concatenate([ids[kept], upserts])
+    order = np.argsort(merged_ids, kind="stable")
+    return merged_ids[order], np.concatenate([kept, np.full(len(upserts), -1, dtype=np.int64)])[order]
+
+def patch_rows(previous: np.ndarray, origin: np.ndarray, dirty_values: np.ndarray) -> np.ndarray:
+    # origin에 따라 이전 배열의 값을 옮기고 새로 만들 행(origin == -1)은 dirty_values로 채운 새 배열 (이전 배열은 변경하지 않음)
+    out = np.empty(len(origin), dtype=np.result_type(previous, dirty_values))
+    kept = origin >= 0
+    out[kept] = previous[origin[kept]]
+    out[~kept] = dirty_values
+    return out
+
+def patch_list(previous: List[Any], origin: np.ndarray, dirty_items: List[Any]) -> List[Any]:
+    # patch_rows의 리스트 버전. 수정/뒤쪽 추가만 있으면(가장 흔한 경우) 복사 후 바뀐 칸만 교체
+    dirty = np.flatnonzero(origin < 0)
+    head = origin[:len(previous)]
+    if len(origin) >= len(previous) and ((head < 0) | (head == np.arange(len(head)))).all():
+        items = previous + [None] * (len(origin) - len(previous))
+        for pos, item in zip(dirty.tolist(), dirty_items): items[pos] = item
+        return items
+    fresh = iter(dirty_items)
+    return [previous[o] if o >= 0 else next(fresh) for o in origin.tolist()]
+
+class FilterIndex:
+    """목록 필터용 역색인: 종목 / 시·도 / (시·도, 시·군·구) → 행 번호(오름차순)와 available_from 컷용 시작일 정렬 배열.
+    행 번호는 적재 순서(id 순) 위치이므로 query 결과를 그대로 쓰면 원래 목록 순서가 유지된다. 결과 배열은 공유되므로 읽기 전용.
+    행별 키 코드 배열을 유지하므로 updated()로 바뀐 행만 다시 코드화한 새 인덱스를 만들 수 있다"""
+
+    def __init__(self, sports: List[Optional[str]], provinces: List[Optional[str]], counties: List[Optional[str]], start_dates: Optional[List[Optional[str]]] = None):
+        # 종목, 시·도, (시·도, 시·군·구), 시작일 → 코드 (시작일은 start_dates가 있을 때만)
+        self.codes: Tuple[Dict[Any, int], ...] = tuple({} for _ in range(3 if start_dates is None else 4))
+        self.columns = self._encode(sports, provinces, counties, start_dates)
+        self._build()
+
+    def _encode(self, sports: List[Optional[str]], provinces: List[Optional[str]], counties: List[Optional[str]], start_dates: Optional[List[Optional[str]]]) -> Tuple[np.ndarray, ...]:
+        keys = (sports, provinces, list(zip(provinces, counties)), start_dates)
+        return tuple(np.fromiter((codes.setdefault(key, len(codes)) for key in column), dtype=np.int64, count=len(column)) for codes, column in zip(self.codes, keys))
+
+    @staticmethod
+    def _frozen(rows: np.ndarray) -> np.ndarray:
+        rows.flags.writeable = False
+        return rows
+
+    def _build(self) -> None:
+        n = len(self.columns[0])
+        self.all_rows = self._frozen(np.arange(n, dtype=np.int64))
+        self.by_sport, self.by_province, self.by_county = (self._postings(column, codes) for column, codes in zip(self.columns[:3], self.codes))
+        # 시작일은 filter_competitions와 같은 문자열 비교: 정렬된 (서로 다른) 날짜에서 available_from 이상인 구간은 bisect_left 이후.
+        # date_rank는 행별 날짜의 정렬 위치이고, 날짜 없는 행은 항상 통과하도록 맨 뒤(len) 위치로 둔다
+        self.date_keys: Optional[List[str]] = None
+        if len(self.codes) > 3:
+            self.date_keys = sorted(d for d in self.codes[3] if d is not None)
+            position = {d: i for i, d in enumerate(self.date_keys)}
+            rank_by_code = np.fromiter((position.get(d, len(self.date_keys)) for d in self.codes[3]), dtype=np.int64, count=len(self.codes[3]))
+            self.date_rank = self._frozen(rank_by_code[self.columns[3]])
+
+    def _postings(self, column: np.ndarray, codes: Dict[Any, int]) -> Dict[Any, np.ndarray]:
+        order = np.argsort(column, kind="stable")
+        present, starts = np.unique(column[order], return_index=True)
+        keys = list(codes)  # 코드 = 삽입 순서
+        return {keys[code]: self._frozen(rows) for code, rows in zip(present.tolist(), np.split(order, starts[1:]))}
+
+    def updated(self, origin: np.ndarray, sports: List[Optional[str]], provinces: List[Optional[str]], counties: List[Optional[str]], start_dates: Optional[List[Optional[str]]] = None) -> "FilterIndex":
+        """행이 추가/수정/삭제된 새 인덱스 (merge_by_id의 origin 기준, 이 인덱스는 변경하지 않음).
+        인자 목록은 origin == -1인 행의 값을 행 순서대로 담는다. 코드화는 바뀐 행만 하고 역색인은 코드 배열에서 다시 묶는다"""
+        index = object.__new__(FilterIndex)
+        index.codes = tuple(dict(codes) for codes in self.codes)
+        index.columns = tuple(patch_rows(previous, origin, dirty) for previous, dirty in zip(self.columns, index._encode(sports, provinces, counties, start_dates)))
+        index._build()
+        return index
+
+    def query(self, sport_category: Optional[str] = None, province: Optional[str] = None, city_county: Optional[str] = None, available_from: Optional[str] = None) -> np.ndarray:
+        """조건에 맞는 행 번호(오름차순). 인자는 normalize_region_filters로 정규화된 값 (None이면 조건 없음)"""
+        postings = []
+        if sport_category is not None: postings.append(self.by_sport.get(sport_category, EMPTY_ROWS))
+        if city_county is not None: postings.append(self.by_county.get((province, city_county), EMPTY_ROWS))
+        elif province is not None: postings.append(self.by_province.get(province, EMPTY_ROWS))
+        rows = self.all_rows
+        for posting in sorted(postings, key=len):
+            rows = posting if rows is self.all_rows else intersect_sorted(rows, posting)
+        if available_from and self.date_keys is not None:
+            cut = bisect.bisect_left(self.date_keys, available_from)
+            if cut: rows = rows[self.date_rank[rows] >= cut]
+        return rows
+
+def competition_index_columns(records: List[CompetitionRecord]) -> Tuple[List[Optional[str]], ...]:
+    return [r.sport_category for r in records], [r.province for r in records], [r.county for r in records], [r.start_date for r in records]
+
+def competition_filter_index(records: List[CompetitionRecord]) -> FilterIndex:
+    return FilterIndex(*competition_index_columns(records))
+
+@dataclass(frozen=True)
+class CompetitionSnapshot:
+    """적재된 대회 레코드의 불변 스냅샷 (요청 간 공유, 절대 변경하지 않음). matrix/index의 행 번호는 records의 위치와 같다"""
+    records: List[CompetitionRecord]
+    matrix: "CompetitionMatrix"
+    index: FilterIndex
+    version: int
+    state: Optional["TableState"]  # 이 스냅샷이 반영한 테이블 상태 (워터마크 컬럼이 없으면 None)
+    loaded_at: float  # 마지막 전체 적재 시각 (증분 반영은 유지)
+    deleted_ids: frozenset = frozenset()  # 소프트 삭제되어 제외한 행 id (행 수 검증용)
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self.state.watermark if self.state else None
+
+    @property
+    def cache_key(self) -> str:
+        # 재시작 후에도 데이터가 같으면 같은 값이 되도록 워터마크 우선 (없으면 이 프로세스의 스냅샷에서만 유효)
+        return self.watermark or f"{self.loaded_at}:{self.version}"
+
+_competition_snapshot: Optional[CompetitionSnapshot] = None
+_competition_snapshot_lock = asyncio.Lock()
+
+class TableState(NamedTuple):
+    """테이블 변경 감지용 상태: 행 수(소프트 삭제 포함) + 최신 워터마크 컬럼 값"""
+    count: int
+    latest: Optional[str]
+
+    @property
+    def watermark(self) -> str:
+        return f"{self.count}|{self.latest}"
+
+async def fetch_table_state(table: str) -> Optional[TableState]:
+    # 행 수 + 최신 updated_at 조합으로 변경 여부를 판단 (컬럼이 없으면 None)
+    try:
+        res = await run_db(supabase.table(table).select(COMPETITION_WATERMARK_COLUMN, count="exact")
+                           .order(COMPETITION_WATERMARK_COLUMN, desc=True, nullsfirst=False).limit(1))
+        return TableState(res.count, res.data[0].get(COMPETITION_WATERMARK_COLUMN) if res.data else None)
+    except Exception:
+        return None
+
+def can_sync(snapshot: Any) -> bool:
+    # 이전 상태의 최신 워터마크 값을 알아야 그 이후 변경분만 조회할 수 있음
+    return snapshot.state is not None and snapshot.state.latest is not None
+
+def needs_full_reload(snapshot: Any) -> bool:
+    # 증분 동기화가 가능하면 전체 재적재는 안전망 주기로만, 아니면 기존 주기대로
+    period = SYNC_FULL_RELOAD_SECONDS if can_sync(snapshot) else COMPETITION_REFRESH_SECONDS
+    return time.time() - snapshot.loaded_at >= period
+
+def split_deleted(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Set[Any]]:
+    # (살아 있는 행, 소프트 삭제된 행 id). 소프트 삭제 컬럼이 없는 테이블은 모든 행이 살아 있음
+    if not SYNC_DELETED_COLUMN: return rows, set()
+    live = [row for row in rows if row.get(SYNC_DELETED_COLUMN) is None]
+    return live, {row["id"] for row in rows if row.get(SYNC_DELETED_COLUMN) is not None}
+
+_soft_delete_columns: Dict[str, Optional[str]] = {}
+
+async def soft_delete_column(table: str) -> Optional[str]:
+    """테이블에 SYNC_DELETED_COLUMN이 있으면 그 이름, 없으면 None. DB에서 직접 조회하는 경로도 스냅샷과 같은 행만 보이도록
+    쿼리에 소프트 삭제 필터를 걸 때 사용 (한 번 확인한 결과를 재사용)"""
+    if not SYNC_DELETED_COLUMN: return None
+    if table not in _soft_delete_columns:
+        try:
+            await run_db(supabase.table(table).select(SYNC_DELETED_COLUMN).limit(1))
+            _soft_delete_columns[table] = SYNC_DELETED_COLUMN
+        except Exception as e:
+            if getattr(e, "code", None) != "42703": raise  # 컬럼 없음(undefined_column) 외의 오류는 다음 요청에서 다시 확인
+            _soft_delete_columns[table] = None
+    return _soft_delete_columns[table]
+
+async def fetch_table_changes(table: str, since: str) -> Tuple[Dict[Any, Dict[str, Any]], Set[Any]]:
+    """워터마크 컬럼 값이 since 이상인 행을 (추가/수정된 행 id → 행, 소프트 삭제된 행 id)로 반환.
+    같은 시각의 경계 행은 다시 받아도 덮어쓰기라 무해하고, id 순으로 조회하므로 조회 도중 수정이 일어나도 페이지가 밀리지 않음"""
+    rows = await fetch_paginated_data(lambda: supabase.table(table).select("*").gte(COMPETITION_WATERMARK_COLUMN, since).order("id"))
+    live, deleted = split_deleted(rows)
+    return {row["id"]: row for row in live}, deleted
+
+def merged_deleted_ids(previous: frozenset, upserts: Dict[Any, Any], deleted: Set[Any]) -> frozenset:
+    return frozenset((previous - upserts.keys()) | deleted)
+
+def apply_competition_changes(snapshot: CompetitionSnapshot, upserts: Dict[Any, Dict[str, Any]], deleted: Set[Any], state: TableState) -> Optional[CompetitionSnapshot]:
+    """변경분을 반영한 새 스냅샷. 바뀐 행만 가공(ingest)하고 행렬/역색인도 바뀐 행만 다시 계산한다.
+    반영 후 행 수가 테이블과 다르면(하드 삭제 등 놓친 변경) None → 호출자가 전체 재적재"""
+    ids = np.fromiter((r.id for r in snapshot.records), dtype=np.int64, count=len(snapshot.records))
+    new_ids, origin = merge_by_id(ids, upserts.keys(), deleted)
+    deleted_ids = merged_deleted_ids(snapshot.deleted_ids, upserts, deleted)
+    if len(new_ids) + len(deleted_ids) != state.count: return None
+    changed = dict(zip(upserts.keys(), ingest_competitions(list(upserts.values()))))
+    dirty = [changed[i] for i in new_ids[origin < 0].tolist()]
+    return CompetitionSnapshot(records=patch_list(snapshot.records, origin, dirty), matrix=snapshot.matrix.updated(origin, dirty), index=snapshot.index.updated(origin, *competition_index_columns(dirty)),
+                               version=snapshot.version + 1, state=state, loaded_at=snapshot.loaded_at, deleted_ids=deleted_ids)
+
+_table_versions: Dict[str, Optional[str]] = {}
+
+async def table_version_loop() -> None:
+    # 목록 테이블의 워터마크를 주기적으로 갱신 (요청 처리 중에는 DB를 조회하지 않고 ETag 계산)
+    # 메모리 스냅샷 테이블은 워터마크가 바뀌면 변경분만 반영하고, 재적재 주기가 지나면 다시 적재
+    while True:
+        for table in LISTING_VERSIONED_TABLES:
+            state = await fetch_table_state(table)
+            _table_versions[table] = state.watermark if state else None
+            if table not in LISTING_SNAPSHOT_TABLES: continue
+            try:
+                snapshot = _listing_snapshots.get(table)
+                if snapshot is None or needs_full_reload(snapshot): await refresh_listing_snapshot(table)
+                elif state is not None and state != snapshot.state: await refresh_listing_snapshot(table, state)
+            except asyncio.CancelledError: raise
+            except Exception as e: print(f"⚠️ {table} 스냅샷 갱신 실패: {e}")
+        await asyncio.sleep(COMPETITION_WATERMARK_POLL_SECONDS)
+
+def build_competition_snapshot(rows: List[Dict[str, Any]], version: int, state: Optional[TableState]) -> CompetitionSnapshot:
+    # 전체 행으로 새 스냅샷 구성 (CPU 작업이므로 이벤트 루프 밖에서 호출)
+    live, deleted_ids = split_deleted(rows)
+    records = ingest_competitions(live)
+    return CompetitionSnapshot(records=records, matrix=CompetitionMatrix(records), index=competition_filter_index(records), version=version,
+                               state=state, loaded_at=time.time(), deleted_ids=frozenset(deleted_ids))
+
+async def refresh_competition_snapshot(state: Optional[TableState] = None) -> CompetitionSnapshot:
+    """대회 스냅샷 교체. state(방금 조회한 테이블 상태)가 주어지고 증분 동기화가 가능하면 변경분만 반영, 아니면 전체 재적재.
+    가공/행렬/역색인 구성은 스레드에서 하고 전역 교체만 이벤트 루프에서 한다 (재적재 중에도 요청 처리가 멈추지 않음)"""
+    global _competition_snapshot
+    async with _competition_snapshot_lock:
+        previous = _competition_snapshot
+        if state is not None and previous is not None and can_sync(previous):
+            upserts, deleted = await fetch_table_changes("competitions", previous.state.latest)
+            snapshot = await asyncio.to_thread(apply_competition_changes, previous, upserts, deleted, state)
+            if snapshot is not None:
+                _competition_snapshot = snapshot
+                print(f"✅ 대회 스냅샷 증분 반영 (v{snapshot.version}, 추가/수정 {len(upserts)}건, 삭제 {len(deleted)}건)")
+                return snapshot
+        state = await fetch_table_state("competitions")
+        all_data = await fetch_paginated_data(lambda count=None: supabase.table("competitions").select("*", count=count).order("id"), count="exact")
+        _competition_snapshot = await asyncio.to_thread(build_competition_snapshot, all_data, previous.version + 1 if previous else 1, state)
+        print(f"✅ 대회 스냅샷 갱신 완료 (v{_competition_snapshot.version}, {len(_competition_snapshot.records)}건)")
+        return _competition_snapshot
+
+async def get_competition_snapshot() -> CompetitionSnapshot:
+    snapshot = _competition_snapshot
+    if snapshot: return snapshot
+    # 콜드 스타트: 동시에 들어온 요청은 락에서 기다렸다가 먼저 적재된 스냅샷을 사용
+    async with _competition_snapshot_lock:
+        snapshot = _competition_snapshot
+    return snapshot or await refresh_competition_snapshot()
+
+async def competition_refresh_loop() -> None:
+    while True:
+        try:
+            snapshot = _competition_snapshot
+            if snapshot is None or needs_full_reload(snapshot): await refresh_competition_snapshot()
+            else:
+                # 워터마크 컬럼이 없으면(None) 주기 재적재만 사용
+                state = await fetch_table_state("competitions")
+                if state is not None and state != snapshot.state: await refresh_competition_snapshot(state)
+        except asyncio.CancelledError: raise
+        except Exception as e: print(f"⚠️ 대회 스냅샷 갱신 실패: {e}")
+        await asyncio.sleep(COMPETITION_WATERMARK_POLL_SECONDS)
+
+def unique_by_title(records):
+    # 제목이 같은 대회는 처음 나온 것만 유지 (제목 없는 행은 제외)
+    seen_titles = set()
+    for item in records:
+        title = item.title
+        if title and title not in seen_titles:
+            seen_titles.add(title)
+            yield item
+
+async def fetch_recommendation_candidates(sports: List[str], available_from: str) -> List[CompetitionRecord]:
+    """스냅샷이 아직 없을 때의 추천 후보 조회. 관심 종목/개최일/소프트 삭제 필터와 필요한 컬럼만 DB에서 처리"""
+    deleted_column = await soft_delete_column("competitions")
+
+    def build_query() -> Any:
+        query = (supabase.table("competitions").select(RECOMMENDATION_COLUMNS)
+                 .in_("sport_category", sports)
+                 # event_period &> [오늘,오늘] == 시작일 >= 오늘 (범위 안의 쉼표 때문에 따옴표 필요)
+                 .or_(f'event_period.nxl."[{available_from},{available_from}]",event_period.is.null'))
+        if deleted_column: query = query.is_(deleted_column, "null")
+        return query.order("id")
+    all_data = await fetch_paginated_data(build_query)
+    return await asyncio.to_thread(ingest_competitions, all_data)
+
+def filter_competitions(records, sport_category: Optional[str] = None, province: Optional[str] = None, city_county: Optional[str] = None, available_from: Optional[str] = None):
+    for record in records:
+        if sport_category and record.sport_category != sport_category: continue
+        if province and province != '전체 지역':
+            if record.province != province: continue
+            if city_county and city_county != '전체 시/군/구' and record.county != city_county: continue
+        if available_from and record.start_date is not None and record.start_date < available_from: continue
+        yield record
+
+
+# ====================================================
+# 목록 테이블 스냅샷 (동호회 / 공공 체육 프로그램)
+# ====================================================
+
+@dataclass(frozen=True)
+class ListingSnapshot:
+    """id 순으로 적재한 목록 테이블의 불변 스냅샷. rows/rows_json/ids/index의 행 번호는 모두 같은 위치를 가리킨다"""
+    table: str
+    rows: List[Dict[str, Any]]
+    rows_json: List[bytes]  # rows를 미리 직렬화한 JSON
+    ids: np.ndarray  # 오름차순 id (키셋 커서 위치 탐색용)
+    index: FilterIndex
+    version: int
+    state: Optional[TableState]
+    loaded_at: float  # 마지막 전체 적재 시각 (증분 반영은 유지)
+    deleted_ids: frozenset = frozenset()
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self.state.watermark if self.state else None
+
+    @property
+    def cache_key(self) -> str:
+        return self.watermark or f"{self.loaded_at}:{self.version}"
+
+_listing_snapshots: Dict[str, ListingSnapshot] = {}
+
+def listing_index_columns(rows: List[Dict[str, Any]]) -> Tuple[List[Optional[str]], ...]:
+    return [r.get("sport_category") for r in rows], [r.get("location_province_city") for r in rows], [r.get("location_county_district") for r in rows]
+
+def build_listing_snapshot(table: str, rows: List[Dict[str, Any]], version: int, state: Optional[TableState], deleted_ids: frozenset = frozenset()) -> ListingSnapshot:
+    # 행 직렬화/역색인 구성은 CPU 작업이므로 요청 경로에서는 스레드에서 호출
+    ids = np.fromiter((r["id"] for r in rows), dtype=np.int64, count=len(rows))
+    return ListingSnapshot(table=table, rows=rows, rows_json=[json_bytes(r) for r in rows], ids=ids, index=FilterIndex(*listing_index_columns(rows)),
+                           version=version, state=state, loaded_at=time.time(), deleted_ids=deleted_ids)
+
+def apply_listing_changes(snapshot: ListingSnapshot, upserts: Dict[Any, Dict[str, Any]], deleted: Set[Any], state: TableState) -> Optional[ListingSnapshot]:
+    """변경분을 반영한 새 스냅샷 (바뀐 행만 직렬화/코드화). 반영 후 행 수가 테이블과 다르면 None → 전체 재적재"""
+    new_ids, origin = merge_by_id(snapshot.ids, upserts.keys(), deleted)
+    deleted_ids = merged_deleted_ids(snapshot.deleted_ids, upserts, deleted)
+    if len(new_ids) + len(deleted_ids) != state.count: return None
+    dirty = [upserts[i] for i in new_ids[origin < 0].tolist()]
+    rows, rows_json = patch_list(snapshot.rows, origin, dirty), patch_list(snapshot.rows_json, origin, [json_bytes(row) for row in dirty])
+    return ListingSnapshot(table=snapshot.table, rows=rows, rows_json=rows_json, ids=new_ids, index=snapshot.index.updated(origin, *listing_index_columns(dirty)),
+                           version=snapshot.version + 1, state=state, loaded_at=snapshot.loaded_at, deleted_ids=deleted_ids)
+
+async def refresh_listing_snapshot(table: str, state: Optional[TableState] = None) -> ListingSnapshot:
+    async def load() -> ListingSnapshot:
+        previous = _listing_snapshots.get(table)
+        if state is not None and previous is not None and can_sync(previous):
+            upserts, deleted = await fetch_table_changes(table, previous.state.latest)
+            snapshot = await asyncio.to_thread(apply_listing_changes, previous, upserts, deleted, state)
+            if snapshot is not None:
+                _listing_snapshots[table] = snapshot
+                print(f"✅ {table} 스냅샷 증분 반영 (v{snapshot.version}, 추가/수정 {len(upserts)}건, 삭제 {len(deleted)}건)")
+                return snapshot
+        current = await fetch_table_state(table)
+        rows, deleted_ids = split_deleted(await fetch_paginated_data(region_query_factory(table, None, None, None)))
+        snapshot = await asyncio.to_thread(build_listing_snapshot, table, rows, previous.version + 1 if previous else 1, current, frozenset(deleted_ids))
+        _listing_snapshots[table] = snapshot
+        print(f"✅ {table} 스냅샷 갱신 완료 (v{snapshot.version}, {len(rows)}건)")
+        return snapshot
+    # 콜드 스타트 요청과 백그라운드 갱신이 겹쳐도 적재는 한 번만
+    return await _single_flight.do(("listing_snapshot", table), load)
+
+async def get_listing_snapshot(table: str) -> ListingSnapshot:
+    return _listing_snapshots.get(table) or await refresh_listing_snapshot(table)
+
+def keyset_slice(ids: np.ndarray, rows: np.ndarray, limit: int, cursor: Optional[int]) -> Tuple[np.ndarray, Optional[int]]:
+    # fetch_keyset_page와 같은 의미를 메모리에서: id > cursor인 행부터 limit개, 더 남아 있으면 마지막 id가 다음 커서
+    if cursor is not None: rows = rows[np.searchsorted(rows, np.searchsorted(ids, cursor, side="right")):]
+    page = rows[:limit]
+    return page, (int(ids[page[-1]]) if len(rows) > limit else None)
+
+async def region_listing_response(table: str, sport_category: Optional[str], province: Optional[str], city_county: Optional[str], limit: Optional[int], cursor: Optional[int], ndjson: bool, if_none_match: Optional[str]) -> Response:
+    """동호회/공공 프로그램 목록 응답. LISTING_SNAPSHOT_TABLES에 있으면 메모리 스냅샷의 역색인으로, 아니면 DB에서 조회"""
+    sport_category, province, city_county = normalize_region_filters(sport_category, province, city_county)
+    snapshot = await get_listing_snapshot(table) if table in LISTING_SNAPSHOT_TABLES else None
+    etag = listing_etag(snapshot.cache_key if snapshot else _table_versions.get(table), sport_category=sport_category, province=province, city_county=city_county,
+                        limit=limit, cursor=cursor, format="ndjson" if ndjson else "json")
+    if etag_matches(if_none_match, etag): return not_modified(etag)
+
+    if snapshot:
+        rows = snapshot.index.query(sport_category, province, city_county)
+        if ndjson: return with_etag(ndjson_rows(snapshot.rows[i] for i in rows.tolist()), etag)
+        if limit is None:
+            return with_etag(prejson_response({"success": True, "count": len(rows)}, [snapshot.rows_json[i] for i in rows.tolist()]), etag)
+        page, next_cursor = keyset_slice(snapshot.ids, rows, limit, cursor)
+        return with_etag(prejson_response({"success": True, "count": len(rows), "next_cursor": next_cursor}, [snapshot.rows_json[i] for i in page.tolist()]), etag)
+
+    # 스냅샷과 같은 행만 보이도록 소프트 삭제된 행 제외
+    deleted_column = await soft_delete_column(table)
+    if ndjson:
+        return with_etag(ndjson_pages(iter_paginated_data(region_query_factory(table, sport_category, province, city_county, deleted_column=deleted_column))), etag)
+
+    async def build_payload() -> Dict[str, Any]:
+        if limit is not None:
+            rows, count, next_cursor = await fetch_keyset_page(
+                region_query_factory(table, sport_category, province, city_county, deleted_column=deleted_column),
+                region_query_factory(table, sport_category, province, city_county, count=LISTING_COUNT_METHOD, deleted_column=deleted_column), limit, cursor)
+            return {"success": True, "count": count, "data": rows, "next_cursor": next_cursor}
+        results = await fetch_paginated_data(region_query_factory(table, sport_category, province, city_county, deleted_column=deleted_column))
+        return {"success": True, "count": len(results), "data": results}
+    key = (table, sport_category, province, city_county, limit, cursor)
+    return with_etag(await coalesced_json_response(key, build_payload), etag)
+
+# ====================================================
+# 추천 결과 구성 및 사전 계산
+# ====================================================
+
+_precomputed_recommendations = TTLCache(maxsize=RECOMMEND_PRECOMPUTE_CACHE_SIZE, ttl=RECOMMEND_PRECOMPUTE_TTL_SECONDS)
+_recommendation_result_cache = TieredCache(maxsize=RECOMMEND_RESULT_CACHE_SIZE, ttl=RECOMMEND_RESULT_CACHE_TTL_SECONDS, path=RECOMMEND_RESULT_CACHE_PATH)
+
+def apply_user_location(user_profile: Dict[str, Any], x: Optional[float], y: Optional[float]) -> Dict[str, Any]:
+    # 프로필 location의 x를 위도, y를 경도로 사용 (기존 동작 유지)
+    if x is not None:
+        user_profile['user_latitude'] = x
+        user_profile['user_longitude'] = y
+    return user_profile
+
+def profile_fingerprint(user_profile: Dict[str, Any]) -> str:
+    """추천 결과에 영향을 주는 프로필 값(나이, 성별, 위치, 관심 종목/실력)의 해시. 값이 바뀌면 사전 계산 결과를 쓰지 않는다"""
+    sports = [(s.get('sport_name'), s.get('skill')) for s in user_profile.get('interesting_sports', [])]
+    key = [user_profile.get('age'), user_profile.get('gender'), user_profile.get('location'), sports]
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False, default=str).encode()).hexdigest()
+
+def build_recommendations(records: List[CompetitionRecord], idx: Any, scores: Any, skill_scores: Any, loc_scores: Any, selected: Dict[str, List[int]]) -> Dict[str, List[Dict[str, Any]]]:
+    # 스냅샷 행은 공유되므로 점수는 선택된 행의 복사본에만 기록
+    return {
+        s: [{**records[idx[k]].row, 'recommendation_score': float(scores[k]), 'skill_similarity': float(skill_scores[k]), 'location_similarity': float(loc_scores[k])} for k in ks]
+        for s, ks in selected.items()
+    }
+
+def select_by_sport(matrix: "CompetitionMatrix", user_sports: Iterable[str], idx: np.ndarray, scores: np.ndarray, top_n: int) -> Dict[str, List[int]]:
+    # score() 결과에서 사용자 관심 종목별 추천 후보 k 목록을 선택
+    by_code = top_n_by_title(matrix.sport[idx], matrix.title[idx], scores, top_n)
+    return {s: by_code.get(matrix.sport_codes.get(s, -1), []) for s in user_sports}
+
+def recommend_many(snapshot: CompetitionSnapshot, user_profiles: List[Dict[str, Any]], top_n: int, today: datetime.date) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """사용자별 종목 추천(recommend_competitions와 같은 결과)을 일괄 계산. CPU 작업이므로 이벤트 루프 밖에서 호출"""
+    matrix, results = snapshot.matrix, []
+    for user_profile, (idx, scores, skill_scores, loc_scores) in zip(user_profiles, matrix.score_many(user_profiles, today)):
+        user_sports = dict.fromkeys(s['sport_name'] for s in user_profile.get('interesting_sports', []))
+        selected = select_by_sport(matrix, user_sports, idx, scores, top_n)
+        results.append(build_recommendations(snapshot.records, idx, scores, skill_scores, loc_scores, selected))
+    return results
+
+def precomputed_is_fresh(entry: Dict[str, Any], profile_hash: str, top_n: int, today: datetime.date) -> bool:
+    if entry.get("profile_hash") != profile_hash or entry.get("available_from") != today.isoformat(): return False
+    if not 0 < top_n <= entry.get("top_n", 0) or time.time() - entry.get("computed_at", 0) > RECOMMEND_PRECOMPUTE_TTL_SECONDS: return False
+    snapshot = _competition_snapshot
+    if snapshot is None: return True
+    # 대회 데이터가 바뀌었으면 무효: 워터마크를 알면 비교, 모르면 현재 스냅샷 적재 이후에 계산된 결과만 사용
+    if snapshot.watermark is not None and entry.get("watermark") is not None: return entry["watermark"] == snapshot.watermark
+    return entry["computed_at"] >= snapshot.loaded_at
+
+async def load_precomputed(user_id: str, profile_hash: str, top_n: int, today: datetime.date, client: Client) -> Optional[Dict[str, Any]]:
+    # 프로세스 내 결과 -> 결과 테이블 순으로 확인하고, 최신인 결과만 반환
+    entry = _precomputed_recommendations.get(user_id)
+    if entry is not None and precomputed_is_fresh(entry, profile_hash, top_n, today): return entry
+    if not RECOMMENDATION_RESULTS_TABLE: return None
+    try: res = await run_db(client.table(RECOMMENDATION_RESULTS_TABLE).select("*").eq("user_id", user_id).maybe_single())
+    except Exception as e:
+        print(f"⚠️ 사전 계산 추천 조회 실패: {e}")
+        return None
+    entry = res.data if res else None
+    if not entry or not precomputed_is_fresh(entry, profile_hash, top_n, today): return None
+    _precomputed_recommendations.set(user_id, entry)
+    return entry
+
+async def store_precomputed(entries: List[Dict[str, Any]]) -> None:
+    for entry in entries: _precomputed_recommendations.set(entry["user_id"], entry)
+    if not RECOMMENDATION_RESULTS_TABLE: return
+    for start in range(0, len(entries), SUPABASE_PAGE_SIZE):
+        chunk = entries[start:start + SUPABASE_PAGE_SIZE]
+        await execute_with_retry(lambda: supabase_service.table(RECOMMENDATION_RESULTS_TABLE).upsert(chunk))
+
+async def fetch_user_profiles(user_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """서비스 클라이언트로 프로필(+관심 종목)을 조회하고 위치를 일괄 해석 (user_ids가 None이면 전체 사용자)"""
+    def profile_query_factory(ids: Optional[List[str]]) -> Callable[[], Any]:
+        def build_query(count: Optional[str] = None) -> Any:
+            query = supabase_service.table("profiles").select("*, interesting_sports(*)", count=count)
+            if ids is not None: query = query.in_("id", ids)
+            return query.order("id")
+        return build_query
+
+    if user_ids is None:
+        profiles = await fetch_paginated_data(profile_query_factory(None), count="exact")
+    else:
+        chunks = [user_ids[i:i + SUPABASE_IN_FILTER_CHUNK] for i in range(0, len(user_ids), SUPABASE_IN_FILTER_CHUNK)]
+        pages = await asyncio.gather(*(fetch_paginated_data(profile_query_factory(ids), count="exact") for ids in chunks))
+        profiles = [profile for page in pages for profile in page]
+    xs, ys = decode_locations([profile.get('location') for profile in profiles])
+    for profile, x, y in zip(profiles, xs.tolist(), ys.tolist()):
+        if not math.isnan(x): apply_user_location(profile, x, y)
+    return profiles
+
+async def precompute_recommendations(user_ids: Optional[List[str]] = None, top_n: int = RECOMMEND_PRECOMPUTE_TOP_N) -> List[Dict[str, Any]]:
+    """현재 대회 스냅샷으로 사용자별 추천을 일괄 계산해 사전 계산 결과로 저장"""
+    if not supabase_service: raise RuntimeError("서비스 키(SUPABASE_SERVICE_ROLE_KEY) 설정 없음")
+    snapshot = await get_competition_snapshot()
+    profiles = await fetch_user_profiles(user_ids)
+    today = datetime.date.today()
+    results = await asyncio.to_thread(recommend_many, snapshot, profiles, top_n, today)
+    computed_at = time.time()
+    entries = [
+        {"user_id": profile["id"], "profile_hash": profile_fingerprint(profile), "watermark": snapshot.watermark, "available_from": today.isoformat(),
+         "top_n": top_n, "computed_at": computed_at, "recommended_by_sport": recommended}
+        for profile, recommended in zip(profiles, results)
+    ]
+    await store_precomputed(entries)
+    return entries
+
+
+# ====================================================
+# 게시글 조회수 (write-behind 버퍼)
+# ====================================================
+
+class ViewCountBuffer:
+    """게시글별 조회수 증가분을 모아 두는 버퍼. 요청마다 DB에 쓰지 않고 flush_view_counts가 주기적으로 한 번에 반영"""
+
+    def __init__(self):
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.flushes = self.flushed_views = 0
+
+    def add(self, board_id: int, amount: int = 1) -> int:
+        # 아직 반영되지 않은 해당 게시글의 증가분(이번 조회 포함)을 반환
+        with self._lock:
+            self._pending[board_id] = self._pending.get(board_id, 0) + amount
+            return self._pending[board_id]
+
+    def drain(self) -> Dict[int, int]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            return pending
+
+    def restore(self, increments: Dict[int, int]) -> None:
+        # 반영 실패 시 증가분을 되돌려 다음 주기에 다시 시도 (그 사이 들어온 증가분과 합산)
+        with self._lock:
+            for board_id, amount in increments.items(): self._pending[board_id] = self._pending.get(board_id, 0) + amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock: pending = sum(self._pending.values())
+        return {"pending_views": pending, "flushes": self.flushes, "flushed_views": self.flushed_views}
+
+_view_count_buffer = ViewCountBuffer()
+
+async def flush_view_counts() -> None:
+    increments = _view_count_buffer.drain()
+    if not increments: return
+    payload = [{"id": board_id, "amount": amount} for board_id, amount in increments.items()]
+    try:
+        # 증가 RPC는 멱등이 아니므로 재시도하지 않음 (서버에서 커밋된 뒤 응답만 실패하면 두 번 더해짐). 실패분은 다음 주기에 다시 보냄
+        await run_db(supabase.rpc(TEAM_BOARD_VIEWS_RPC, {"increments": payload}))
+    except Exception as e:
+        _view_count_buffer.restore(increments)
+        if getattr(e, "code", None) == "PGRST202":  # PostgREST: 함수 없음
+            print(f"❌ 조회수 반영 RPC '{TEAM_BOARD_VIEWS_RPC}'가 DB에 없습니다. server/migrations/001_increment_team_board_views.sql을 적용하세요 (조회수는 메모리에만 쌓임)")
+        else:
+            print(f"⚠️ 조회수 반영 실패 (다음 주기에 재시도): {e}")
+        return
+    _view_count_buffer.flushes += 1
+    _view_count_buffer.flushed_views += sum(increments.values())
+
+async def view_count_flush_loop() -> None:
+    while True:
+        await asyncio.sleep(TEAM_BOARD_VIEWS_FLUSH_SECONDS)
+        try: await flush_view_counts()
+        except asyncio.CancelledError: raise
+        except Exception as e: print(f"⚠️ 조회수 반영 작업 오류: {e}")
+
+
 # ====================================================
 # 공개 엔드포인트 (인증 불필요)
 # ====================================================
@@ -237,97 +1549,110 @@ def calculate_recommendation_score(user_profile: Dict[str, Any], competition: Di
 @app.get("/")
 def read_root(): return {"message": "Sports API is running!", "version": "2.3.0"}
 
+@app.get("/metrics", response_model=Dict[str, Any], dependencies=[Depends(require_internal_token)])
+def get_metrics():
+    return {"success": True, "caches": {"jwt": _jwt_cache.stats(), "authed_client": _authed_client_cache.stats(), "user_profile": _user_profile_cache.stats(), "recommendation_result": _recommendation_result_cache.stats()}, "team_board_views": _view_count_buffer.stats(), "single_flight": _single_flight.stats()}
+
 @app.get("/competitions", response_model=Dict[str, Any])
-async def search_competitions(sport_category: Optional[SportCategory] = None, province: Optional[str] = None, city_county: Optional[str] = None, available_from: Optional[str] = None):
+async def search_competitions(sport_category: Optional[SportCategory] = None, province: Optional[str] = None, city_county: Optional[str] = None, available_from: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=LISTING_MAX_LIMIT), cursor: Optional[int] = None, stream: bool = False, accept: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
     try:
-        query = supabase.table("competitions").select("*")
-        if sport_category: query = query.eq("sport_category", sport_category.value)
-        if province and province != '전체 지역':
-            query = query.eq("location_province_city", province)
-            if city_county and city_county != '전체 시/군/구': query = query.eq("location_county_district", city_county)
-            
-        all_data = await fetch_paginated_data(query)
-        processed = [p for item in all_data if (p := process_competition_data(item, available_from))]
-        
-        seen_titles = set()
-        unique_competitions = []
-        
-        for item in processed:
-            title = item.get('title')
-            if title and title not in seen_titles:
-                seen_titles.add(title)
-                unique_competitions.append(item)
-        
-        return {"success": True, "count": len(unique_competitions), "data": unique_competitions}
+        snapshot = await get_competition_snapshot()
+        ndjson = wants_ndjson(stream, accept)
+        sport, province, city_county = normalize_region_filters(sport_category.value if sport_category else None, province, city_county)
+        # 같은 스냅샷 + 같은 조건이면 응답이 같으므로 필터링/직렬화 전에 304로 응답
+        etag = listing_etag(snapshot.cache_key, sport_category=sport, province=province, city_county=city_county, available_from=available_from,
+                            limit=limit, cursor=cursor, format="ndjson" if ndjson else "json")
+        if etag_matches(if_none_match, etag): return not_modified(etag)
+        # 역색인으로 조건에 맞는 행만 고른 뒤(id 순 유지) 제목 중복 제거
+        unique_competitions = unique_by_title(snapshot.records[i] for i in snapshot.index.query(sport, province, city_county, available_from).tolist())
+        if ndjson: return with_etag(ndjson_rows(r.row for r in unique_competitions), etag)
+        if limit is None:
+            data = [r.row_json for r in unique_competitions]
+            return with_etag(prejson_response({"success": True, "count": len(data)}, data), etag)
+
+        # 제목 중복 제거는 항상 처음부터 적용해야 페이지 경계를 넘어서도 일관됨 (메모리 스냅샷이라 전체 순회 비용이 작음)
+        page: List[CompetitionRecord] = []
+        count = remaining = 0
+        for record in unique_competitions:
+            count += 1
+            if cursor is not None and record.id <= cursor: continue
+            remaining += 1
+            if len(page) < limit: page.append(record)
+        next_cursor = page[-1].id if remaining > limit else None
+        return with_etag(prejson_response({"success": True, "count": count, "next_cursor": next_cursor}, [r.row_json for r in page]), etag)
 
     except Exception as e: raise HTTPException(500, f"대회 검색 오류: {e}")
 
+@app.get("/competitions/nearby", response_model=Dict[str, Any])
+async def search_nearby_competitions(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180), radius_km: float = Query(10.0, gt=0, le=MAX_DIST_KM), sport_category: Optional[SportCategory] = None, available_from: Optional[str] = None):
+    if not supabase: raise HTTPException(503, "Supabase 연결 실패")
+    try:
+        snapshot = await get_competition_snapshot()
+        idx, distance = snapshot.matrix.nearby(lat, lon, radius_km)
+        # 가까운 순으로 정렬되어 있으므로 제목 중복 제거 시 가장 가까운 대회가 남음
+        nearby = [snapshot.records[i] for i in idx.tolist()]
+        distance_by_record = {id(r): d for r, d in zip(nearby, distance.tolist())}
+        filtered = filter_competitions(nearby, sport_category.value if sport_category else None, available_from=available_from)
+        data = [{**r.row, "distance_km": distance_by_record[id(r)]} for r in unique_by_title(filtered)]
+        return FastJSONResponse({"success": True, "count": len(data), "data": data})
+    except Exception as e: raise HTTPException(500, f"주변 대회 검색 오류: {e}")
+
 @app.get("/public-programs", response_model=Dict[str, Any])
-async def search_public_programs(sport_category: Optional[str] = None, province: Optional[str] = None, city_county: Optional[str] = None):
+async def search_public_programs(sport_category: Optional[str] = None, province: Optional[str] = None, city_county: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=LISTING_MAX_LIMIT), cursor: Optional[int] = None, stream: bool = False, accept: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
     try:
-        query = supabase.table("public_sport_programs").select("*")
-        if sport_category and sport_category != '전체 종목': query = query.eq("sport_category", sport_category)
-        if province and province != '전체 지역': 
-            query = query.eq("location_province_city", province)
-            if city_county and city_county != '전체 시/군/구': query = query.eq("location_county_district", city_county)
-        results = await fetch_paginated_data(query)
-        return {"success": True, "count": len(results), "data": results}
+        return await region_listing_response("public_sport_programs", sport_category, province, city_county, limit, cursor, wants_ndjson(stream, accept), if_none_match)
     except Exception as e: raise HTTPException(500, f"공공 체육 프로그램 조회 오류: {e}")
 
 @app.get("/clubs", response_model=Dict[str, Any])
-async def search_clubs(sport_category: Optional[str] = None, province: Optional[str] = None, city_county: Optional[str] = None):
+async def search_clubs(sport_category: Optional[str] = None, province: Optional[str] = None, city_county: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=LISTING_MAX_LIMIT), cursor: Optional[int] = None, stream: bool = False, accept: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
     try:
-        query = supabase.table("sport_clubs").select("*")
-        if sport_category and sport_category != '전체 종목': query = query.eq("sport_category", sport_category)
-        if province and province != '전체 지역': 
-            query = query.eq("location_province_city", province)
-            if city_county and city_county != '전체 시/군/구': query = query.eq("location_county_district", city_county)
-        results = await fetch_paginated_data(query)
-        return {"success": True, "count": len(results), "data": results}
+        return await region_listing_response("sport_clubs", sport_category, province, city_county, limit, cursor, wants_ndjson(stream, accept), if_none_match)
     except Exception as e: raise HTTPException(500, f"동호회 조회 오류: {e}")
 
 @app.get("/team-board", response_model=Dict[str, Any])
 async def get_team_board_posts(sport_category: Optional[str] = None, recruitment_status: Optional[str] = None):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
     try:
-        query = supabase.table("team_board").select("*, profiles(nickname)").eq("is_active", True)
-        if sport_category and sport_category != '전체 종목': query = query.eq("sport_category", sport_category)
-        if recruitment_status and recruitment_status != '전체': query = query.eq("recruitment_status", recruitment_status)
-        response = query.order("created_at", desc=True).limit(100).execute()
-        return {"success": True, "data": response.data}
+        sport_category = None if not sport_category or sport_category == '전체 종목' else sport_category
+        recruitment_status = None if not recruitment_status or recruitment_status == '전체' else recruitment_status
+
+        async def build_payload() -> Dict[str, Any]:
+            query = supabase.table("team_board").select("*, profiles(nickname)").eq("is_active", True)
+            if sport_category: query = query.eq("sport_category", sport_category)
+            if recruitment_status: query = query.eq("recruitment_status", recruitment_status)
+            response = await run_db(query.order("created_at", desc=True).limit(100))
+            return {"success": True, "data": response.data}
+        return await coalesced_json_response(("team_board", sport_category, recruitment_status), build_payload)
     except Exception as e: raise HTTPException(500, f"게시글 목록 조회 실패: {e}")
 
 @app.get("/team-board/{board_id}", response_model=Dict[str, Any])
-async def get_team_board_detail(board_id: int):
+async def get_team_board_detail(board_id: int, include_replies: bool = False):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
     try:
-        # profiles 조인을 제거하고 user_id를 직접 선택
-        post_res = supabase.table("team_board").select("*, user_id").eq("id", board_id).single().execute()
+        # 작성자 닉네임(과 요청 시 댓글)을 임베드해 한 번의 조회로 가져옴
+        columns = "*, profiles(nickname), replies(*, profiles(nickname))" if include_replies else "*, profiles(nickname)"
+        query = supabase.table("team_board").select(columns).eq("id", board_id)
+        if include_replies: query = query.order("created_at", foreign_table="replies")
+        post_res = await run_db(query.single())
         if not post_res.data: raise HTTPException(404, "게시글을 찾을 수 없습니다.")
-        
-        # 조회수 업데이트는 그대로 유지
-        new_views = (post_res.data.get("views_count") or 0) + 1
-        supabase.table("team_board").update({"views_count": new_views}).eq("id", board_id).execute()
-        post_res.data['views_count'] = new_views
-        
-        # 클라이언트에서 작성자 닉네임을 사용하기 위해 profiles 테이블에서 닉네임을 별도로 조회
-        author_profile_res = supabase.table("profiles").select("nickname").eq("id", post_res.data['user_id']).single().execute()
-        if author_profile_res.data:
-            post_res.data['profiles'] = {'nickname': author_profile_res.data['nickname']}
-        else:
-            post_res.data['profiles'] = {'nickname': '익명'}
-            
-        return {"success": True, "data": post_res.data}
+        post = post_res.data
+
+        # 조회수는 버퍼에 누적했다가 주기적으로 원자적 증가 (응답에는 아직 반영 전인 증가분까지 포함)
+        post['views_count'] = (post.get("views_count") or 0) + _view_count_buffer.add(board_id)
+        if not post.get('profiles'): post['profiles'] = {'nickname': '익명'}
+        if not include_replies: return {"success": True, "data": post}
+        replies = post.pop('replies', None) or []
+        return {"success": True, "data": post, "replies": replies}
     except Exception as e: raise HTTPException(500, f"게시글 상세 조회 실패: {e}")
 
 @app.get("/team-board/{board_id}/replies", response_model=Dict[str, Any])
 async def get_replies(board_id: int):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
     try:
-        res = supabase.table("replies").select("*, profiles(nickname)").eq("board_id", board_id).order("created_at").execute()
+        res = await run_db(supabase.table("replies").select("*, profiles(nickname)").eq("board_id", board_id).order("created_at"))
         return {"success": True, "data": res.data}
     except Exception as e: raise HTTPException(500, f"댓글 조회 실패: {e}")
 
@@ -341,7 +1666,7 @@ async def create_team_board_post(post: TeamBoardCreate, current_user_id: str = D
         supabase_authed = get_authed_supabase_client(authorization.credentials)
         data = post.dict()
         data['user_id'] = current_user_id
-        response = supabase_authed.table("team_board").insert(data).execute()
+        response = await run_db(supabase_authed.table("team_board").insert(data))
         return {"success": True, "message": "게시글이 등록되었습니다.", "data": response.data[0]}
     except Exception as e: raise HTTPException(500, f"게시글 작성 오류: {e}")
 
@@ -351,7 +1676,7 @@ async def update_team_board_post(board_id: int, post_update: TeamBoardUpdate, cu
         supabase_authed = get_authed_supabase_client(authorization.credentials)
         
         # 1. 게시글 조회 및 작성자 확인
-        post_res = supabase_authed.table("team_board").select("user_id").eq("id", board_id).single().execute()
+        post_res = await run_db(supabase_authed.table("team_board").select("user_id").eq("id", board_id).single())
         if not post_res.data: raise HTTPException(404, "게시글 없음")
         if post_res.data['user_id'] != current_user_id: raise HTTPException(403, "수정 권한 없음")
 
@@ -359,7 +1684,7 @@ async def update_team_board_post(board_id: int, post_update: TeamBoardUpdate, cu
         update_data = post_update.dict(exclude_unset=True)
         if not update_data: raise HTTPException(400, "수정할 내용 없음")
         
-        response = supabase_authed.table("team_board").update(update_data).eq("id", board_id).execute()
+        response = await run_db(supabase_authed.table("team_board").update(update_data).eq("id", board_id))
         return {"success": True, "message": "게시글이 수정되었습니다.", "data": response.data[0]}
     except Exception as e: raise HTTPException(500, f"게시글 수정 오류: {e}")
 
@@ -369,12 +1694,12 @@ async def delete_team_board_post(board_id: int, current_user_id: str = Depends(g
         supabase_authed = get_authed_supabase_client(authorization.credentials)
         
         # 1. 게시글 조회 및 작성자 확인
-        post_res = supabase_authed.table("team_board").select("user_id").eq("id", board_id).single().execute()
+        post_res = await run_db(supabase_authed.table("team_board").select("user_id").eq("id", board_id).single())
         if not post_res.data: raise HTTPException(404, "게시글 없음")
         if post_res.data['user_id'] != current_user_id: raise HTTPException(403, "삭제 권한 없음")
 
         # 2. 데이터 삭제 (is_active를 False로)
-        response = supabase_authed.table("team_board").update({"is_active": False}).eq("id", board_id).execute()
+        response = await run_db(supabase_authed.table("team_board").update({"is_active": False}).eq("id", board_id))
         return {"success": True, "message": "게시글이 삭제되었습니다."}
     except Exception as e: raise HTTPException(500, f"게시글 삭제 오류: {e}")
 
@@ -385,22 +1710,28 @@ async def create_reply(board_id: int, reply: ReplyCreate, current_user_id: str =
         data = reply.dict()
         data["board_id"] = board_id
         data["user_id"] = current_user_id
-        response = supabase_authed.table("replies").insert(data).execute()
+        response = await run_db(supabase_authed.table("replies").insert(data))
         return {"success": True, "message": "댓글이 등록되었습니다.", "data": response.data[0]}
     except Exception as e: raise HTTPException(500, f"댓글 작성 오류: {e}")
 
+_user_profile_cache = TTLCache(maxsize=USER_PROFILE_CACHE_SIZE, ttl=USER_PROFILE_CACHE_TTL_SECONDS)
+
 async def get_user_profile(user_id: str, supabase_authed: Client) -> Dict[str, Any]:
-    profile_res = supabase_authed.table("profiles").select("*, interesting_sports(*)").eq("id", user_id).maybe_single().execute()
+    # 캐시된 프로필은 요청 간 공유되므로 읽기 전용으로 다룬다
+    cached = _user_profile_cache.get(user_id)
+    if cached is not None: return cached
+    profile_res = await run_db(supabase_authed.table("profiles").select("*, interesting_sports(*)").eq("id", user_id).maybe_single())
     if not profile_res.data: raise HTTPException(404, "사용자 프로필을 찾을 수 없습니다.")
-    user_profile = profile_res.data
-    if user_profile.get('location'):
-        try:
-            geom = wkb.loads(unhexlify(user_profile['location']))
-            user_profile['user_latitude'] = geom.x
-            user_profile['user_longitude'] = geom.y
-        except: pass
+    user_profile = apply_user_location(profile_res.data, *decode_location(profile_res.data.get('location')))
+    _user_profile_cache.set(user_id, user_profile)
     return user_profile
 
+@app.post("/profile/invalidate", response_model=Dict[str, Any])
+async def invalidate_user_profile(current_user_id: str = Depends(get_current_user_id)):
+    # 앱에서 프로필/관심 종목을 저장한 직후 호출 (다른 워커의 캐시는 USER_PROFILE_CACHE_TTL_SECONDS 후 만료)
+    _user_profile_cache.pop(current_user_id)
+    return {"success": True, "message": "프로필 캐시가 초기화되었습니다."}
+
 @app.get("/recommend/competitions", response_model=Dict[str, Any])
 async def recommend_competitions(current_user_id: str = Depends(get_current_user_id), authorization: HTTPAuthorizationCredentials = Depends(security), top_n: int = 3):
     if not supabase: raise HTTPException(503, "Supabase 연결 실패")
@@ -409,36 +1740,65 @@ async def recommend_competitions(current_user_id: str = Depends(get_current_user
         user_profile = await get_user_profile(current_user_id, supabase_authed)
         user_sports_map = {s['sport_name']: s['skill'] for s in user_profile.get('interesting_sports', [])}
         if not user_sports_map: return {"success": True, "count": 0, "message": "관심 종목 없음"}
-        all_competitions = await fetch_paginated_data(supabase.table("competitions").select("*"))
-        
-        scored_competitions_by_sport: Dict[str, List[Dict[str, Any]]] = {s: [] for s in user_sports_map}
-        available_from = datetime.date.today().isoformat()
-        for comp in all_competitions:
-            proc_comp = process_competition_data(comp.copy(), available_from)
-            if not proc_comp: continue
-            score, skill_s, loc_s = calculate_recommendation_score(user_profile, proc_comp)
-            if score > 0 and proc_comp.get("sport_category") in scored_competitions_by_sport:
-                proc_comp.update({'recommendation_score': score, 'skill_similarity': skill_s, 'location_similarity': loc_s})
-                scored_competitions_by_sport[proc_comp["sport_category"]].append(proc_comp)
-
-        unique_scored_competitions = {} 
-        
-        for sport, scored_list in scored_competitions_by_sport.items():
-            best_by_title: Dict[str, Dict[str, Any]] = {}
-            for comp in scored_list:
-                title = comp.get('title')
-                score = comp.get('recommendation_score', 0.0)
-                
-                if title and (title not in best_by_title or score > best_by_title[title]['recommendation_score']):
-                    best_by_title[title] = comp
-            
-            unique_scored_competitions[sport] = list(best_by_title.values())
-
-        final_recs = {
-            s: sorted(c, key=lambda x: x['recommendation_score'], reverse=True)[:top_n] 
-            for s, c in unique_scored_competitions.items()
-        }
+        today = datetime.date.today()
+        profile_hash = profile_fingerprint(user_profile)
+        snapshot = _competition_snapshot
+        # 추천 결과는 프로필, 대회 데이터, top_n, 날짜가 같으면 동일 (콜드 스타트 후보 조회 결과는 캐시하지 않음)
+        result_key = f"{current_user_id}|{profile_hash}|{snapshot.cache_key}|{top_n}|{today.isoformat()}" if snapshot else None
+        final_recs = _recommendation_result_cache.get(result_key) if result_key else None
+        if final_recs is not None:
+            return FastJSONResponse({"success": True, "count": sum(len(v) for v in final_recs.values()), "recommended_by_sport": final_recs})
+
+        # 배치 작업으로 미리 계산한 결과가 최신이면 그대로 사용 (프로필/대회 데이터/날짜가 같고 top_n 이상 계산된 경우)
+        precomputed = await load_precomputed(current_user_id, profile_hash, top_n, today, supabase_authed)
+        if precomputed:
+            final_recs = {s: recs[:top_n] for s, recs in precomputed["recommended_by_sport"].items()}
+            return FastJSONResponse({"success": True, "count": sum(len(v) for v in final_recs.values()), "recommended_by_sport": final_recs})
+
+        if snapshot:
+            records, matrix = snapshot.records, snapshot.matrix
+        else:
+            # 콜드 스타트: 전체 스냅샷 적재를 기다리지 않고 필요한 행/컬럼만 조회
+            records = await fetch_recommendation_candidates(list(user_sports_map), today.isoformat())
+            matrix = CompetitionMatrix(records)
         
+        idx, scores, skill_scores, loc_scores = matrix.score(user_profile, today)
+        final_recs = build_recommendations(records, idx, scores, skill_scores, loc_scores, select_by_sport(matrix, user_sports_map, idx, scores, top_n))
+        if result_key: _recommendation_result_cache.set(result_key, final_recs)
+
         total_count = sum(len(v) for v in final_recs.values())
-        return {"success": True, "count": total_count, "recommended_by_sport": final_recs}
-    except Exception as e: raise HTTPException(500, f"AI 추천 오류: {e}")
\ No newline at end of file
+        return FastJSONResponse({"success": True, "count": total_count, "recommended_by_sport": final_recs})
+    except Exception as e: raise HTTPException(500, f"AI 추천 오류: {e}")
+
+@app.post("/recommend/competitions/batch", response_model=Dict[str, Any])
+async def recommend_competitions_batch(request: RecommendBatchRequest, _: None = Depends(require_internal_token)):
+    if not supabase or not supabase_service: raise HTTPException(503, "Supabase 서비스 클라이언트 설정 없음")
+    if request.top_n < 1: raise HTTPException(400, "top_n은 1 이상이어야 합니다.")
+    try:
+        entries = await precompute_recommendations(request.user_ids, request.top_n)
+        response: Dict[str, Any] = {"success": True, "count": len(entries)}
+        if request.include_results: response["results"] = {e["user_id"]: e["recommended_by_sport"] for e in entries}
+        return response
+    except Exception as e: raise HTTPException(500, f"추천 일괄 계산 오류: {e}")
+
+
+# ====================================================
+# 배치 작업 (cron 등에서 실행: python main.py precompute-recommendations)
+# ====================================================
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sports API 배치 작업")
+    commands = parser.add_subparsers(dest="command", required=True)
+    precompute = commands.add_parser("precompute-recommendations", help="사용자별 추천을 사전 계산해 결과 테이블에 저장")
+    precompute.add_argument("--user-id", action="append", dest="user_ids", help="대상 사용자 (여러 번 지정 가능, 생략 시 전체)")
+    precompute.add_argument("--top-n", type=int, default=RECOMMEND_PRECOMPUTE_TOP_N)
+    args = parser.parse_args()
+    if not supabase or not supabase_service: raise SystemExit("SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY 설정 필요")
+    if not RECOMMENDATION_RESULTS_TABLE: raise SystemExit("RECOMMENDATION_RESULTS_TABLE 설정 필요 (API 서버가 결과를 읽는 테이블)")
+    started = time.time()
+    entries = asyncio.run(precompute_recommendations(args.user_ids, args.top_n))
+    _db_executor.shutdown()
+    print(f"✅ 추천 사전 계산 완료 ({len(entries)}명, {time.time() - started:.1f}초)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+-- 게시글 조회수 write-behind (main.py flush_view_counts)가 호출하는 원자적 증가 함수.
+-- 서버 배포 전에 Supabase SQL 편집기 등에서 한 번 실행해야 하며, 없으면 조회수가 반영되지 않고 버퍼에 남는다.
+-- 이름을 바꾸면 TEAM_BOARD_VIEWS_RPC 환경 변수도 같이 바꾼다.
+create or replace function increment_team_board_views(increments jsonb) returns void
+language sql security definer as $$
+  update team_board t set views_count = coalesce(t.views_count, 0) + (i->>'amount')::int
+  from jsonb_array_elements(increments) i where t.id = (i->>'id')::bigint;
+$$;